@@ -1,12 +1,33 @@
 """Command line interface for proc_format."""
 
 import os
+import sys
+import json
 import argparse
 
-from proc_format import process_file, ProCFormatterContext
+from proc_format import process_file, format_content, vprint, warn_summary, ProCFormatterContext
+from proc_format.events import EventCollector
+from proc_format.scheduler import ClangFormatScheduler, DEFAULT_TIMEOUT, set_scheduler
+from proc_format.edits import compute_edits
+from proc_format.archive import read_archive, format_segment_record
+from proc_format.scan import scan_paths, collect_files
+from proc_format.registry import find_configs
+from proc_format.profiling import PatternProfile, benchmark_configs
+from proc_format.batch import (parse_shard, check_files, merge_manifests,
+                               SHARD_STRATEGIES, STATUS_UNCHANGED)
 
-def main():
-    """Entry point for the `proc_format` command line interface."""
+def main(argv=None):
+    """Entry point for the `proc_format` command line interface.
+
+    When the first argument names one of :data:`COMMANDS` the remaining
+    arguments are handed to that subcommand.  Otherwise the arguments
+    are an input and an output file to format.
+    """
+
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] in COMMANDS:
+        return COMMANDS[argv[0]](argv[1:])
 
     parser = argparse.ArgumentParser(
         description="Format Pro*C files by aligning EXEC SQL and formatting C code."
@@ -14,24 +35,411 @@ def main():
     parser.add_argument("input_file", help="Input file to process.")
     parser.add_argument("output_file", help="Output file to save the formatted content.")
     parser.add_argument("--clang-format", default="clang-format", help="Path to clang-format executable.")
+    add_scheduler_arguments(parser)
     parser.add_argument("--debug", default="debug", help="Path to debug directory.")
     parser.add_argument("--keep", action="store_true", help="Do not delete debug directory before processing.")
+    parser.add_argument("--coalesce", action="store_true",
+                        help="Give consecutive single-line EXEC SQL statements one shared marker.")
+    parser.add_argument("--debug-archive", default=None,
+                        help="Append debug output to this JSON Lines file instead of the debug directory.")
     parser.add_argument("--no-registry-parents", action="store_true",
                         help="Do not search parent directories for .exec-sql-parser files.")
     parser.add_argument("--terse", action="store_true",
                         help="Suppress non-critical warnings.")
+    add_events_arguments(parser)
+    add_profile_arguments(parser)
     parser.add_argument("--silent", action="store_true",
                         help="Suppress all output.")
     parser.add_argument("-v", "--verbose", action="count", default=0,
                         help="Increase verbosity; repeat for more detail.")
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     if not os.path.exists(args.input_file):
         print("Error: Input file does not exist: {}" % (args.input_file))
         return
 
-    process_file(ProCFormatterContext(args))
+    scheduler = configure_scheduler(args)
+    args.events = EventCollector(args.events_file)
+    args.profile = PatternProfile() if args.profile_registry else None
+    ctx = ProCFormatterContext(args)
+    try:
+        process_file(ctx)
+    finally:
+        if ctx.debug_archive is not None:
+            ctx.debug_archive.close()
+        args.events.close()
+    warn_summary(args.events, ctx, header="Warnings:")
+    vprint(ctx, 1, scheduler.summary())
+    if args.profile is not None:
+        vprint(ctx, 0, "Registry patterns:")
+        for line in args.profile.report(args.profile_top):
+            vprint(ctx, 0, "  " + line)
+
+def add_scheduler_arguments(parser):
+    """Add the options of the clang-format scheduler to ``parser``."""
+    parser.add_argument("--clang-timeout", type=timeout_seconds, default=DEFAULT_TIMEOUT,
+                        help="Kill clang-format after this many seconds; 0 disables the limit "
+                        "(default %(default)s).")
+    parser.add_argument("--clang-jobs", type=positive_int, default=None,
+                        help="Maximum concurrent clang-format processes; defaults to one per CPU.")
+    parser.add_argument("--clang-retry-timeouts", action="store_true",
+                        help="Retry a clang-format run once after it times out.")
+
+def add_events_arguments(parser):
+    """Add the warning event options to ``parser``."""
+    parser.add_argument("--events-file", default=None,
+                        help="Append every warning event to this JSON Lines file.")
+
+def add_profile_arguments(parser):
+    """Add the registry pattern profiling options to ``parser``."""
+    parser.add_argument("--profile-registry", action="store_true",
+                        help="Time each registry pattern during capture and report the most expensive.")
+    parser.add_argument("--profile-top", type=int, default=10,
+                        help="Number of patterns reported by --profile-registry (default %(default)s).")
+
+def configure_scheduler(args):
+    """Install and return the scheduler configured by ``args``."""
+    scheduler = ClangFormatScheduler(args.clang_jobs, args.clang_timeout or None,
+                                     retry_timeouts=args.clang_retry_timeouts)
+    set_scheduler(scheduler)
+    return scheduler
+
+def positive_int(text):
+    """Return ``text`` as an integer of at least 1."""
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected an integer, got '{0}'".format(text))
+    if value < 1:
+        raise argparse.ArgumentTypeError("must be at least 1, got {0}".format(value))
+    return value
+
+def timeout_seconds(text):
+    """Return ``text`` as a positive number of seconds, or 0 for no limit."""
+    try:
+        value = float(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected a number, got '{0}'".format(text))
+    if not (value == 0 or 0 < value < float("inf")):
+        raise argparse.ArgumentTypeError("must be positive or 0 for no limit, got {0}".format(text))
+    return value
+
+def parse_region(text):
+    """Return the ``(first, last)`` line pair of a ``FIRST:LAST`` string."""
+    try:
+        first, last = [int(part) for part in text.split(':')]
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected FIRST:LAST, got '{0}'".format(text))
+    if first < 1 or last < first:
+        raise argparse.ArgumentTypeError("invalid line range '{0}'".format(text))
+    return (first, last)
+
+def edits_main(argv):
+    """Entry point for the ``edits`` subcommand.
+
+    The Pro*C buffer is read from standard input and a JSON object of
+    the form ``{"edits": [...]}`` is written to standard output.  See
+    :mod:`proc_format.edits` for the layout of each edit.
+    """
+
+    parser = argparse.ArgumentParser(
+        prog="proc_format edits",
+        description="Print the edits that format a Pro*C buffer read from stdin as JSON."
+    )
+    parser.add_argument("--assume-filename", default=os.path.join(os.getcwd(), "-"),
+                        help="Path of the buffer; locates .exec-sql-parser files.")
+    parser.add_argument("--region", type=parse_region, default=None,
+                        help="Only report edits touching lines FIRST:LAST (1-based, inclusive).")
+    parser.add_argument("--clang-format", default="clang-format", help="Path to clang-format executable.")
+    add_scheduler_arguments(parser)
+    parser.add_argument("--debug", default=None, help="Path to debug directory; none by default.")
+    parser.add_argument("--keep", action="store_true", help="Do not delete debug directory before processing.")
+    parser.add_argument("--coalesce", action="store_true",
+                        help="Give consecutive single-line EXEC SQL statements one shared marker.")
+    parser.add_argument("--no-registry-parents", action="store_true",
+                        help="Do not search parent directories for .exec-sql-parser files.")
+    parser.add_argument("--terse", action="store_true",
+                        help="Suppress non-critical warnings.")
+    add_events_arguments(parser)
+
+    args = parser.parse_args(argv)
+    args.input_file = args.assume_filename
+    args.output_file = None
+
+    configure_scheduler(args)
+    args.events = EventCollector(args.events_file)
+    ctx = ProCFormatterContext(args)
+    pc_before = sys.stdin.read()
+    try:
+        pc_after = format_content(ctx, pc_before)
+    finally:
+        args.events.close()
+    warn_summary(args.events, ctx, header="Warnings:")
+    json.dump({"edits": compute_edits(pc_before, pc_after, args.region)}, sys.stdout)
+    sys.stdout.write("\n")
+
+def debug_show_main(argv):
+    """Entry point for the ``debug-show`` subcommand.
+
+    Prints records of a debug archive written with ``--debug-archive``.
+    Segments are shown in the layout of the ``sql/NNN`` debug files
+    unless ``--json`` is given.  When an archive holds several runs for
+    the same file only the most recent is shown.
+    """
+
+    parser = argparse.ArgumentParser(
+        prog="proc_format debug-show",
+        description="Query a debug archive by file and segment index."
+    )
+    parser.add_argument("archive", help="Debug archive written with --debug-archive.")
+    parser.add_argument("--file", default=None, help="Input file path or base name.")
+    parser.add_argument("--index", type=int, default=None, help="Segment (marker) number.")
+    parser.add_argument("--stage", default=None,
+                        help="Show a stage such as before.c instead of segments.")
+    parser.add_argument("--json", action="store_true", help="Print the raw JSON records.")
+
+    args = parser.parse_args(argv)
+
+    kind = "segment" if args.stage is None else "stage"
+    records = []
+    runs = {}
+    for record in read_archive(args.archive, args.file, args.index, kind):
+        if args.stage is not None and record["name"] != args.stage:
+            continue
+        if runs.get(record["file"]) != record["run"]:
+            # A later run of the same file replaces the earlier one.
+            records = [r for r in records if r["file"] != record["file"]]
+            runs[record["file"]] = record["run"]
+        records.append(record)
+
+    if not records:
+        print("No matching records in {0}".format(args.archive), file=sys.stderr)
+        return 1
+    for record in records:
+        if args.json:
+            print(json.dumps(record, sort_keys=True))
+        elif kind == "stage":
+            sys.stdout.write(record["content"])
+        else:
+            print("{0} :{1}:".format(record["file"], record["index"]))
+            print(format_segment_record(record))
+    return 0
+
+def scan_main(argv):
+    """Entry point for the ``scan`` subcommand.
+
+    Runs only the capture stage over the given files and directories
+    and prints construct statistics and capture failures as JSON.  The
+    exit status is 1 when any failure was found.
+    """
+
+    parser = argparse.ArgumentParser(
+        prog="proc_format scan",
+        description="Count EXEC SQL constructs without formatting and report capture failures as JSON."
+    )
+    parser.add_argument("paths", nargs="+", help="Files or directories to scan.")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="Number of worker processes; defaults to one per CPU.")
+    parser.add_argument("--ext", action="append", default=None,
+                        help="File extension searched for in directories; repeatable (default .pc).")
+    parser.add_argument("--no-registry-parents", action="store_true",
+                        help="Do not search parent directories for .exec-sql-parser files.")
+    parser.add_argument("-o", "--output", default=None, help="Write the JSON report to this file.")
+
+    args = parser.parse_args(argv)
+
+    extensions = tuple(args.ext) if args.ext else (".pc",)
+    summary = scan_paths(args.paths, args.jobs, extensions,
+                         not args.no_registry_parents)
+    write_json(summary, args.output)
+    return 1 if summary["failures"] else 0
+
+def validate_registry_main(argv):
+    """Entry point for the ``validate-registry`` subcommand.
+
+    Benchmarks the patterns of the default registry and of every
+    ``.exec-sql-parser`` file in effect for the corpus against the
+    corpus lines.  The exit status is 1 when a pattern fails to compile
+    or exceeds ``--max-us`` microseconds per line.
+    """
+
+    parser = argparse.ArgumentParser(
+        prog="proc_format validate-registry",
+        description="Benchmark the EXEC SQL registry patterns in effect for a sample corpus."
+    )
+    parser.add_argument("paths", nargs="+", help="Corpus files or directories.")
+    parser.add_argument("--ext", action="append", default=None,
+                        help="File extension searched for in directories; repeatable (default .pc).")
+    parser.add_argument("--no-registry-parents", action="store_true",
+                        help="Do not search parent directories for .exec-sql-parser files.")
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="Match each pattern against the corpus this many times (default %(default)s).")
+    parser.add_argument("--max-us", type=float, default=None,
+                        help="Fail when a pattern takes more microseconds per line than this.")
+    parser.add_argument("--top", type=int, default=10,
+                        help="Number of patterns listed in the text report (default %(default)s).")
+    parser.add_argument("--json", action="store_true", help="Print every result as JSON.")
+    parser.add_argument("-v", "--verbose", action="count", default=0,
+                        help="Name each pattern on stderr before benchmarking it.")
+
+    args = parser.parse_args(argv)
+
+    extensions = tuple(args.ext) if args.ext else (".pc",)
+    files = collect_files(args.paths, extensions)
+    configs = {}
+    lines = []
+    for path in files:
+        directory = os.path.dirname(os.path.abspath(path))
+        for cfg_path, data in find_configs(directory, not args.no_registry_parents):
+            configs.setdefault(cfg_path, data)
+        with open(path, 'r') as f:
+            lines.extend(line.strip() for line in f)
+
+    def progress(result):
+        if args.verbose:
+            print("{config}: {construct} ({kind})".format(**result), file=sys.stderr)
+
+    results = benchmark_configs(sorted(configs.items()), lines, max(args.repeat, 1), progress)
+    failed = [result for result in results
+              if "error" in result
+              or (args.max_us is not None and result["us_per_line"] > args.max_us)]
+    if args.json:
+        write_json({"files": len(files), "lines": len(lines), "patterns": results})
+    else:
+        print("{0} patterns over {1} lines of {2} files".format(len(results), len(lines), len(files)))
+        # Failures beyond the top entries are listed as well.
+        shown = results[:args.top]
+        for result in shown + [result for result in failed if result not in shown]:
+            if "error" in result:
+                print("     error  {config}: {construct} ({kind}): {error}".format(**result))
+            else:
+                print("{us_per_line:8.3f}us  {config}: {construct} ({kind}), "
+                      "{matches} matches".format(**result))
+    return 1 if failed else 0
+
+def shard_type(text):
+    try:
+        return parse_shard(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def check_main(argv):
+    """Entry point for the ``check`` subcommand.
+
+    Formats the files of one shard in memory and writes a JSON manifest
+    of their status.  The exit status is 1 when any file would change
+    or failed to format.
+    """
+
+    parser = argparse.ArgumentParser(
+        prog="proc_format check",
+        description="Check that Pro*C files are formatted, optionally for one shard of the work set."
+    )
+    parser.add_argument("paths", nargs="+", help="Files or directories to check.")
+    parser.add_argument("--shard", type=shard_type, default=(1, 1),
+                        help="Only check shard I of N (1-based), e.g. 2/4.")
+    parser.add_argument("--shard-strategy", choices=SHARD_STRATEGIES, default="hash",
+                        help="Partition by path hash or by size-balanced bins.")
+    parser.add_argument("--manifest", default=None,
+                        help="Write the shard manifest to this file instead of stdout.")
+    parser.add_argument("--write", action="store_true", help="Rewrite files that change.")
+    parser.add_argument("--coalesce", action="store_true",
+                        help="Give consecutive single-line EXEC SQL statements one shared marker.")
+    parser.add_argument("--sequential", action="store_true",
+                        help="Process one file at a time instead of overlapping the stages of successive files.")
+    parser.add_argument("--terse", action="store_true",
+                        help="Do not print the warning summary.")
+    add_events_arguments(parser)
+    parser.add_argument("--ext", action="append", default=None,
+                        help="File extension searched for in directories; repeatable (default .pc).")
+    parser.add_argument("--clang-format", default="clang-format", help="Path to clang-format executable.")
+    add_scheduler_arguments(parser)
+    add_profile_arguments(parser)
+    parser.add_argument("--no-registry-parents", action="store_true",
+                        help="Do not search parent directories for .exec-sql-parser files.")
+
+    args = parser.parse_args(argv)
+
+    extensions = tuple(args.ext) if args.ext else (".pc",)
+    scheduler = configure_scheduler(args)
+    events = EventCollector(args.events_file)
+    profile = PatternProfile() if args.profile_registry else None
+    try:
+        manifest = check_files(collect_files(args.paths, extensions), args.shard,
+                               args.shard_strategy, clang_format=args.clang_format,
+                               search_parents=not args.no_registry_parents,
+                               write=args.write, events=events, coalesce=args.coalesce,
+                               profile=profile,
+                               pipelined=not args.sequential)
+    finally:
+        events.close()
+    warn_summary(events, args, header="Warnings:")
+    manifest["clang_format"] = scheduler.stats()
+    if profile is not None:
+        manifest["registry_profile"] = profile.top(args.profile_top)
+    write_json(manifest, args.manifest)
+    return 0 if set(manifest["totals"]) <= set([STATUS_UNCHANGED]) else 1
+
+def merge_main(argv):
+    """Entry point for the ``merge`` subcommand.
+
+    Combines the manifests written by ``check --shard`` into a single
+    report.  The exit status is 1 when a file changed or failed, when
+    shards are missing or disagree on the shard count, or when a file
+    was checked by more than one shard.
+    """
+
+    parser = argparse.ArgumentParser(
+        prog="proc_format merge",
+        description="Merge shard manifests written by 'check' into one report."
+    )
+    parser.add_argument("manifests", nargs="+", help="Manifest files to merge.")
+    parser.add_argument("-o", "--output", default=None, help="Write the report to this file.")
+
+    args = parser.parse_args(argv)
+
+    manifests = []
+    for path in args.manifests:
+        with open(path, 'r') as f:
+            manifests.append(json.load(f))
+    try:
+        report = merge_manifests(manifests)
+    except ValueError as e:
+        print("Error: {0}".format(e), file=sys.stderr)
+        return 1
+    write_json(report, args.output)
+    status = 0
+    if report["missing_shards"]:
+        print("Missing shards: {0}".format(report["missing_shards"]), file=sys.stderr)
+        status = 1
+    if report["duplicates"]:
+        # The shards computed different partitions, e.g. from other paths.
+        print("Files checked by more than one shard: {0}".format(report["duplicates"]),
+              file=sys.stderr)
+        status = 1
+    if status:
+        return status
+    return 0 if set(report["totals"]) <= set([STATUS_UNCHANGED]) else 1
+
+def write_json(data, path=None):
+    """Write ``data`` as indented JSON to ``path`` or standard output."""
+    if path:
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+            f.write("\n")
+    else:
+        json.dump(data, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+
+COMMANDS = {
+    "edits": edits_main,
+    "debug-show": debug_show_main,
+    "scan": scan_main,
+    "check": check_main,
+    "merge": merge_main,
+    "validate-registry": validate_registry_main,
+}
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
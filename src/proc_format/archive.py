@@ -0,0 +1,127 @@
+"""Single-file debug archive.
+
+The default debug output writes one file per captured EXEC SQL segment
+plus the ``before.*``/``after.*`` stages of every input.  On large
+batches that produces a great many small files.  :class:`DebugArchive`
+instead appends the same information to one JSON Lines file, one
+record per line:
+
+``{"kind": "stage", "run": ..., "file": ..., "name": "before.pc", "content": ...}``
+    The complete text of a formatting stage, named after the debug file
+    it replaces (``before.pc``, ``before.c``, ``after.c``, ``after.pc``).
+
+``{"kind": "segment", "run": ..., "file": ..., "index": n, ...}``
+    Captured segment ``n`` with its ``construct``, ``pattern``,
+    ``end_pattern`` (``null`` for single-line constructs), ``stripped``
+    first line and the ``original`` and ``formatted`` lines.  These
+    replace the ``sql/NNN`` and ``exec-sql--before/after.txt`` files.
+
+``run`` identifies the :class:`DebugArchive` that wrote the record so
+that several runs may append to the same archive.  Each record is
+written with a single ``os.write`` while holding an exclusive
+``fcntl.lockf`` lock on the archive, so records of concurrent processes,
+also on NFS where ``O_APPEND`` is not atomic, never interleave.  Where
+``fcntl`` is unavailable only the threads of one process are
+serialised, and each process should use its own archive.
+"""
+
+import os
+import json
+import time
+import threading
+import itertools
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+_run_counter = itertools.count(1)
+
+# ``lockf`` locks belong to the process, so the threads of one process
+# are serialised by this lock instead.
+_write_lock = threading.Lock()
+
+
+class DebugArchive(object):
+    """Append debug records to the JSON Lines file at ``path``."""
+
+    def __init__(self, path):
+        self.path = path
+        self.run = "{0}-{1}-{2}".format(time.strftime("%Y%m%dT%H%M%S"), os.getpid(),
+                                        next(_run_counter))
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+
+    def write(self, record):
+        record["run"] = self.run
+        data = (json.dumps(record, sort_keys=True) + "\n").encode('utf-8')
+        with _write_lock:
+            if fcntl is not None:
+                fcntl.lockf(self.fd, fcntl.LOCK_EX)
+            try:
+                # The lock, not O_APPEND alone, keeps the record whole;
+                # seek to the end in case another client extended the file.
+                os.lseek(self.fd, 0, os.SEEK_END)
+                while data:
+                    data = data[os.write(self.fd, data):]
+            finally:
+                if fcntl is not None:
+                    fcntl.lockf(self.fd, fcntl.LOCK_UN)
+
+    def write_stage(self, file_name, name, content):
+        """Record the full ``content`` of stage ``name`` for ``file_name``."""
+        self.write({"kind": "stage", "file": file_name, "name": name,
+                    "content": content})
+
+    def write_segment(self, file_name, index, construct, details,
+                      stripped_line, original, formatted):
+        """Record captured segment ``index`` of ``file_name``."""
+        self.write({"kind": "segment", "file": file_name, "index": index,
+                    "construct": construct,
+                    "pattern": details.get("pattern"),
+                    "end_pattern": details.get("end_pattern"),
+                    "stripped": stripped_line,
+                    "original": list(original),
+                    "formatted": list(formatted)})
+
+    def flush(self):
+        # Records are written unbuffered; nothing is pending.
+        pass
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def read_archive(path, file_name=None, index=None, kind=None):
+    """Yield the records of the archive at ``path`` matching the filters.
+
+    ``file_name`` matches either the recorded path or its base name.
+    ``index`` selects one segment and ``kind`` one record kind.
+    """
+    with open(path, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if kind is not None and record.get("kind") != kind:
+                continue
+            if file_name is not None and file_name not in (
+                    record.get("file"), os.path.basename(record.get("file") or "")):
+                continue
+            if index is not None and record.get("index") != index:
+                continue
+            yield record
+
+
+def format_segment_record(record):
+    """Return a segment record laid out like an ``sql/NNN`` debug file."""
+    text = "Construct:  '{0}'\n".format(record["construct"])
+    text += "Pattern:    '{0}'\n".format(record["pattern"])
+    if record.get("end_pattern") is not None:
+        text += "EndPattern: '{0}'\n".format(record["end_pattern"])
+    text += "\nStripped:   '{0}'\n\n".format(record["stripped"])
+    text += "\n".join(record["original"]) + "\n\n"
+    text += "Formatted:\n\n" + "\n".join(record["formatted"]) + "\n"
+    return text
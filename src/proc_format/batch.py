@@ -0,0 +1,260 @@
+"""Formatting checks over a work set of files, split into shards.
+
+Large trees are checked on several machines by giving each one a shard
+``I/N`` of the work set.  :func:`shard_files` picks the shard
+deterministically, so every machine computes the same partition without
+coordination, and :func:`check_files` writes a manifest recording the
+status, timing and output hash of each file.  :func:`merge_manifests`
+combines the manifests of all shards into one report.
+
+Two partition strategies are available:
+
+``hash``
+    A file belongs to shard ``md5(path) % N``.  Adding or removing a
+    file never moves any other file between shards.
+
+``size``
+    Files are sorted by decreasing size and each is placed in the
+    currently lightest shard, balancing the bytes per shard.
+"""
+
+import os
+import time
+import hashlib
+import argparse
+
+from .core import (ProCFormatterContext, capture_stage, clang_stage, restore_stage,
+                   close_debug)
+from .pipeline import run_pipeline, StageError
+
+SHARD_STRATEGIES = ("hash", "size")
+
+STATUS_UNCHANGED = "unchanged"
+STATUS_CHANGED = "changed"
+STATUS_ERROR = "error"
+
+
+def parse_shard(text):
+    """Return the ``(index, count)`` pair of a 1-based ``I/N`` string."""
+    try:
+        index, count = [int(part) for part in text.split('/')]
+    except ValueError:
+        raise ValueError("expected I/N, got '{0}'".format(text))
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError("shard index must be between 1 and N, got '{0}'".format(text))
+    return (index, count)
+
+
+def _path_key(path):
+    # Separators are normalised so that every platform agrees on a shard.
+    return path.replace(os.sep, '/').encode('utf-8')
+
+
+def shard_files(files, index, count, strategy="hash"):
+    """Return the files of shard ``index`` (1-based) out of ``count``."""
+    if strategy not in SHARD_STRATEGIES:
+        raise ValueError("unknown shard strategy '{0}'".format(strategy))
+    if count == 1:
+        return sorted(files)
+    if strategy == "hash":
+        selected = [path for path in files
+                    if int(hashlib.md5(_path_key(path)).hexdigest(), 16) % count == index - 1]
+        return sorted(selected)
+    sizes = []
+    for path in files:
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+        sizes.append((-size, path))
+    sizes.sort()
+    loads = [0] * count
+    bins = [[] for _ in range(count)]
+    for negative_size, path in sizes:
+        lightest = loads.index(min(loads))
+        loads[lightest] -= negative_size
+        bins[lightest].append(path)
+    return sorted(bins[index - 1])
+
+
+class CheckJob(object):
+    """One file passing through the stages of :func:`check_files`."""
+
+    __slots__ = ["path", "options", "ctx", "state", "entry", "seconds"]
+
+    def __init__(self, path, options):
+        self.path = path
+        self.options = options
+        self.ctx = None
+        self.state = None
+        self.entry = {"status": STATUS_ERROR, "hash": None}
+        self.seconds = 0.0      # time spent in the stages of this file
+
+
+def _timed(stage):
+    # Add the time spent in ``stage`` to the job, excluding any time the
+    # job waits between stages of a pipeline.
+    def run(job):
+        start = time.time()
+        try:
+            return stage(job)
+        finally:
+            job.seconds += time.time() - start
+    run.__name__ = stage.__name__
+    return run
+
+
+def _capture(job):
+    options = job.options
+    args = argparse.Namespace(input_file=job.path, output_file=job.path,
+                              clang_format=options.get("clang_format", "clang-format"),
+                              debug=None, keep=False, terse=True,
+                              events=options.get("events"),
+                              coalesce=options.get("coalesce", False),
+                              profile=options.get("profile"),
+                              no_registry_parents=not options.get("search_parents", True))
+    job.ctx = ProCFormatterContext(args)
+    with open(job.path, 'r') as f:
+        pc_before = f.read()
+    job.state = capture_stage(job.ctx, pc_before)
+    return job
+
+
+def _clang(job):
+    clang_stage(job.ctx, job.state)
+    return job
+
+
+def _restore(job):
+    pc_after = restore_stage(job.ctx, job.state)
+    entry = job.entry
+    entry["hash"] = hashlib.sha256(pc_after.encode('utf-8')).hexdigest()
+    if pc_after == job.state.pc_before:
+        entry["status"] = STATUS_UNCHANGED
+    else:
+        entry["status"] = STATUS_CHANGED
+        if job.options.get("write"):
+            with open(job.path, 'w') as f:
+                f.write(pc_after)
+    return job
+
+
+CHECK_STAGES = (_timed(_capture), _timed(_clang), _timed(_restore))
+
+
+def _finish(job, error=None):
+    # Complete the manifest entry of ``job`` and release its state.
+    entry = job.entry
+    if job.ctx is not None:
+        close_debug(job.ctx)
+    if error is not None:
+        entry["status"] = STATUS_ERROR
+        entry["hash"] = None
+        entry["error"] = "{0}: {1}".format(type(error).__name__, error)
+    events = job.options.get("events")
+    if events is not None:
+        entry["warnings"] = events.total(job.path)
+    entry["seconds"] = round(job.seconds, 6)
+    job.state = None
+    job.ctx = None
+    return entry
+
+
+def check_file(path, clang_format="clang-format", search_parents=True, write=False,
+               events=None, coalesce=False, profile=None):
+    """Format ``path`` in memory and return its manifest entry.
+
+    The entry records the ``status`` (``unchanged``, ``changed`` or
+    ``error``), the ``seconds`` spent in its stages, not counting waits
+    in the :func:`check_files` pipeline, and the SHA-256 ``hash`` of the
+    formatted text.  With ``write`` a changed file is rewritten.  When
+    an ``events`` collector is given, warnings are counted there and
+    their number is recorded as ``warnings``.  ``coalesce`` shares one
+    marker between consecutive single-line statements and a ``profile``
+    records the cost of the registry patterns.
+    """
+    job = CheckJob(path, {"clang_format": clang_format, "search_parents": search_parents,
+                          "write": write, "events": events, "coalesce": coalesce,
+                          "profile": profile})
+    try:
+        for stage in CHECK_STAGES:
+            stage(job)
+    except Exception as e:
+        return _finish(job, e)
+    return _finish(job)
+
+
+def _totals(entries):
+    totals = {}
+    for entry in entries:
+        totals[entry["status"]] = totals.get(entry["status"], 0) + 1
+    return totals
+
+
+def check_files(files, shard=(1, 1), strategy="hash", pipelined=True, **options):
+    """Check the files of ``shard`` and return the shard's manifest.
+
+    ``options`` are those of :func:`check_file`.  With ``pipelined``
+    the capture, ``clang-format`` and restore stages of successive files
+    overlap through :func:`~proc_format.pipeline.run_pipeline`.
+    """
+    start = time.time()
+    selected = shard_files(files, shard[0], shard[1], strategy)
+    results = {}
+    if pipelined:
+        jobs = [CheckJob(path, options) for path in selected]
+        for value in run_pipeline(jobs, CHECK_STAGES):
+            if isinstance(value, StageError):
+                results[value.item.path] = _finish(value.item, value.error)
+            else:
+                results[value.path] = _finish(value)
+    else:
+        for path in selected:
+            results[path] = check_file(path, **options)
+    return {
+        "shard": list(shard),
+        "strategy": strategy,
+        "files": results,
+        "totals": _totals(results.values()),
+        "seconds": round(time.time() - start, 6),
+    }
+
+
+def merge_manifests(manifests):
+    """Combine shard ``manifests`` into one report.
+
+    The report lists every file, the totals per status, the shards that
+    were merged and any ``missing_shards`` or ``duplicates`` found.
+    The ``clang_format`` latency statistics of each shard are kept
+    under the shard's index.
+    """
+    files = {}
+    duplicates = []
+    shards = set()
+    counts = set()
+    seconds = 0.0
+    clang_format = {}
+    for manifest in manifests:
+        index, count = manifest["shard"]
+        shards.add(index)
+        if "clang_format" in manifest:
+            clang_format[str(index)] = manifest["clang_format"]
+        counts.add(count)
+        seconds += manifest.get("seconds", 0.0)
+        for path, entry in manifest["files"].items():
+            if path in files:
+                duplicates.append(path)
+            files[path] = entry
+    count = max(counts) if counts else 0
+    if len(counts) > 1:
+        raise ValueError("manifests disagree on the shard count: {0}".format(sorted(counts)))
+    return {
+        "files": files,
+        "clang_format": clang_format,
+        "totals": _totals(files.values()),
+        "shards": sorted(shards),
+        "shard_count": count,
+        "missing_shards": [i for i in range(1, count + 1) if i not in shards],
+        "duplicates": sorted(duplicates),
+        "seconds": round(seconds, 6),
+    }
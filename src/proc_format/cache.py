@@ -0,0 +1,57 @@
+"""Reuse of formatted EXEC SQL segments across runs on the same file.
+
+Editor integrations and scripted loops call
+:func:`~proc_format.core.process_file` on the same file over and over,
+usually after a small edit.  Every block is captured and passed through
+:func:`~proc_format.core.format_exec_sql_block` again, although most of
+them did not change.
+
+A :class:`SegmentCache` carried by a context as ``ctx.segment_cache``
+keeps the formatted segments of the previous run of each file, keyed
+by construct and original text.  Capture reuses them for unchanged
+blocks and formats only the new or edited ones.  Only the latest run of
+each file is kept, so the cache never holds more than the segments of
+``max_files`` files.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_FILES = 64
+
+
+class SegmentCache(object):
+    """Formatted segments of the last run of up to ``max_files`` files."""
+
+    def __init__(self, max_files=DEFAULT_MAX_FILES):
+        self.max_files = max_files
+        self._lock = threading.Lock()
+        self._files = OrderedDict()     # path -> {key: formatted lines}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(construct, details, block, format_sql=True):
+        """Return the cache key of original ``block`` captured as ``construct``."""
+        return (construct, details.get("action"), format_sql, tuple(block))
+
+    def previous(self, file_name):
+        """Return the segments of the last run of ``file_name``."""
+        with self._lock:
+            return self._files.get(os.path.abspath(file_name), {})
+
+    def store(self, file_name, segments, hits=0, misses=0):
+        """Replace the segments kept for ``file_name`` by those of this run."""
+        path = os.path.abspath(file_name)
+        with self._lock:
+            self._files.pop(path, None)
+            self._files[path] = segments
+            while len(self._files) > self.max_files:
+                self._files.popitem(last=False)
+            self.hits += hits
+            self.misses += misses
+
+    def clear(self):
+        with self._lock:
+            self._files.clear()
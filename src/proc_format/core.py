@@ -3,7 +3,6 @@
 import sys
 import os
 import re
-import subprocess
 import logging
 import shutil
 
@@ -12,12 +11,17 @@ try:
 except ImportError:  # pragma: no cover - sqlparse optional
     sqlparse = None
 
-from .registry import load_registry
+from .archive import DebugArchive
+from .cache import SegmentCache
+from .keywords import normalize_keywords
+from .scheduler import get_scheduler
+from .registry import load_registry, compile_registry
 from .registry import re_DECLARE_BEGIN, re_DECLARE_END, re_EXEC_SQL, re_INDENT
 
 logging.basicConfig(level=logging.INFO)
 
 MARKER_PREFIX = "// EXEC SQL MARKER"
+MARKER_WORD = "MARKER"              # Literal part of every marker, however spaced
 re_MARKER_PREFIX = re.compile(r"([{}])?\s*//\s\s*EXEC\s\s*SQL\s\s*MARKER\s\s*:(\d+):")
 
 BEFORE_PC = "before.pc"             # Original Pro*C content before formatting
@@ -47,6 +51,11 @@ class ProCFormatterContext:
         "keep",
         "debug",
         "sql_dir",
+        "debug_archive",
+        "events",
+        "coalesce",
+        "profile",
+        "segment_cache",
         "registry",
         "verbose",
         "terse",
@@ -59,7 +68,21 @@ class ProCFormatterContext:
         self.clang_format_path = args.clang_format
         self.keep = args.keep
         self.debug = args.debug
-        self.sql_dir = os.path.join(self.debug, SQL_DIR)
+        # A debug archive replaces the per-segment files of ``debug``.
+        self.debug_archive = getattr(args, 'debug_archive', None)
+        if isinstance(self.debug_archive, str):
+            self.debug_archive = DebugArchive(self.debug_archive)
+        if self.debug_archive is not None:
+            self.debug = None
+        self.sql_dir = os.path.join(self.debug, SQL_DIR) if self.debug else None
+        # Warnings are counted by an ``EventCollector`` when one is given.
+        self.events = getattr(args, 'events', None)
+        self.coalesce = getattr(args, 'coalesce', False)
+        # A ``PatternProfile`` times the registry patterns during capture.
+        self.profile = getattr(args, 'profile', None)
+        # A ``SegmentCache`` shared by the contexts of repeated runs
+        # reuses the segments of blocks that did not change.
+        self.segment_cache = getattr(args, 'segment_cache', None)
         self.verbose = getattr(args, 'verbose', 0)
         self.terse = getattr(args, 'terse', False)
         self.silent = getattr(args, 'silent', False)
@@ -80,6 +103,13 @@ def write_file(debug_dir, file_name, content):
     with open_file(debug_dir, file_name) as f:
         f.write(content)
 
+def write_stage(ctx, file_name, content):
+    """Record the ``content`` of a formatting stage for debugging."""
+    if ctx.debug:
+        write_file(ctx.debug, file_name, content)
+    if ctx.debug_archive is not None:
+        ctx.debug_archive.write_stage(ctx.input_file, file_name, content)
+
 def vprint(ctx, level, message, end="\n"):
     """Print ``message`` when ``ctx.verbose`` meets ``level``."""
     if ctx is not None and getattr(ctx, 'verbose', 0) >= level and not getattr(ctx, 'silent', False):
@@ -90,9 +120,74 @@ def warn(ctx, message, end="\n"):
     if ctx is None or (not getattr(ctx, 'terse', False) and not getattr(ctx, 'silent', False)):
         print(message, end=end, file=sys.stderr)
 
+def report(ctx, reason, construct=None, detail=None):
+    """Report a warning of ``reason`` about a block of ``construct``.
+
+    The event is counted by ``ctx.events`` when the context carries an
+    :class:`~proc_format.events.EventCollector`; otherwise it is printed
+    at once with :func:`warn`.
+    """
+    events = getattr(ctx, 'events', None)
+    if events is not None:
+        events.add(reason, construct, getattr(ctx, 'input_file', None), detail)
+    elif detail is not None:
+        warn(ctx, "{0}: {1}".format(reason, detail))
+    else:
+        warn(ctx, reason)
+
+def warn_summary(events, ctx=None, file_name=None, header=None):
+    """Print the summary of ``events`` unless ``ctx`` is terse or silent.
+
+    Only the events of ``file_name`` are summarised when it is given.
+    """
+    if events is None or not events.total(file_name):
+        return
+    if header is not None:
+        warn(ctx, header)
+    for line in events.summary(file_name):
+        warn(ctx, "  " + line)
+
 def process_file(ctx):
     """Format a Pro*C file while preserving EXEC SQL segments.
 
+    ``ctx.input_file`` is read, formatted by :func:`format_content` and
+    the result written to ``ctx.output_file``.  When the contexts of
+    repeated calls share a ``segment_cache``, only the EXEC SQL blocks
+    changed since the previous call on the file are formatted again.
+    """
+
+    vprint(ctx, 1, "Formatting: {0}".format(ctx.input_file))
+
+    with open(ctx.input_file, 'r') as f:
+        pc_before = f.read()
+
+    pc_after = format_content(ctx, pc_before)
+
+    # Step 4: Write output to file
+    with open(ctx.output_file, 'w') as f:
+        f.write(pc_after)
+
+    vprint(ctx, 1, "File processed successfully: {0}".format(ctx.input_file))
+
+class FormatState(object):
+    """Intermediate results of formatting one input.
+
+    Created by :func:`capture_stage` and completed by
+    :func:`clang_stage` and :func:`restore_stage`.
+    """
+
+    __slots__ = ["pc_before", "c_before", "segments", "c_after", "pc_after"]
+
+    def __init__(self, pc_before):
+        self.pc_before = pc_before
+        self.c_before = None
+        self.segments = None
+        self.c_after = None
+        self.pc_after = None
+
+def format_content(ctx, pc_before):
+    """Return the Pro*C text ``pc_before`` formatted.
+
     The function performs the following steps:
 
     1.  Capture EXEC SQL constructs and replace them with numbered
@@ -100,72 +195,105 @@ def process_file(ctx):
     2.  Run ``clang-format`` over the resulting C code.
     3.  Restore the captured EXEC SQL text in place of the markers.
 
-    Temporary files are written beneath ``ctx.debug`` for inspection.
-    """
-
-    vprint(ctx, 1, "Formatting: {0}".format(ctx.input_file))
+    Temporary files are written beneath ``ctx.debug`` for inspection,
+    or appended to ``ctx.debug_archive`` when one is open.  When neither
+    is set no debug output is produced.
 
-    if not ctx.keep:
-        if os.path.exists(ctx.debug):
-            shutil.rmtree(ctx.debug, ignore_errors=True)
-    if not os.path.exists(ctx.debug):
-        os.makedirs(ctx.debug)
+    Each step is available separately as :func:`capture_stage`,
+    :func:`clang_stage` and :func:`restore_stage` so that the steps of
+    several inputs can overlap; see :mod:`proc_format.pipeline`.
+    """
+    try:
+        state = capture_stage(ctx, pc_before)
+        clang_stage(ctx, state)
+        return restore_stage(ctx, state)
+    finally:
+        close_debug(ctx)
 
-    if os.path.exists(ctx.sql_dir):
-        shutil.rmtree(ctx.sql_dir, ignore_errors=True)
-    os.makedirs(ctx.sql_dir)
+def capture_stage(ctx, pc_before):
+    """Prepare debug output and capture the EXEC SQL of ``pc_before``.
 
-    with open(ctx.input_file, 'r') as f:
-        pc_before = f.read()
-    write_file(ctx.debug, BEFORE_PC, pc_before)
-
-    file_name = EXEC_SQL_FILE_MODEL % "before"
-    ctx.exec_sql_before_fh = open(os.path.join(ctx.debug, file_name), 'w') or \
-                                exit("Failed to create file '%s'" % file_name)
-    file_name = EXEC_SQL_FILE_MODEL % "after"
-    ctx.exec_sql_after_fh = open(os.path.join(ctx.debug, file_name), 'w') or \
-                                exit("Failed to create file '%s'" % file_name)
+    Returns the :class:`FormatState` passed on to :func:`clang_stage`.
+    """
+    if ctx.debug:
+        if not ctx.keep:
+            if os.path.exists(ctx.debug):
+                shutil.rmtree(ctx.debug, ignore_errors=True)
+        if not os.path.exists(ctx.debug):
+            os.makedirs(ctx.debug)
+
+        if os.path.exists(ctx.sql_dir):
+            shutil.rmtree(ctx.sql_dir, ignore_errors=True)
+        os.makedirs(ctx.sql_dir)
+
+        file_name = EXEC_SQL_FILE_MODEL % "before"
+        ctx.exec_sql_before_fh = open(os.path.join(ctx.debug, file_name), 'w') or \
+                                    exit("Failed to create file '%s'" % file_name)
+        file_name = EXEC_SQL_FILE_MODEL % "after"
+        ctx.exec_sql_after_fh = open(os.path.join(ctx.debug, file_name), 'w') or \
+                                    exit("Failed to create file '%s'" % file_name)
+
+    write_stage(ctx, BEFORE_PC, pc_before)
 
     # Step 1: Mark EXEC SQL lines
-    marked_content, exec_sql_segments = capture_exec_sql_blocks(ctx, pc_before.splitlines(), ctx.registry)
-    c_before = "\n".join(marked_content)
-    write_file(ctx.debug, BEFORE_C, c_before)
-
+    state = FormatState(pc_before)
+    marked_content, state.segments = capture_exec_sql_blocks(ctx, pc_before.splitlines(), ctx.registry)
+    state.c_before = "\n".join(marked_content)
+    write_stage(ctx, BEFORE_C, state.c_before)
+    return state
+
+def clang_stage(ctx, state):
+    """Run ``clang-format`` over the marked C code of ``state``."""
     # Step 2: Format using clang-format
-    c_after = format_with_clang(ctx, c_before)
-    write_file(ctx.debug, AFTER_C, c_after)
+    state.c_after = format_with_clang(ctx, state.c_before)
+    write_stage(ctx, AFTER_C, state.c_after)
+    return state
 
+def restore_stage(ctx, state):
+    """Restore the EXEC SQL of ``state`` and return the formatted text."""
     # Step 3: Restore EXEC SQL lines
-    pc_after = restore_exec_sql_blocks(c_after, exec_sql_segments, ctx)
-    write_file(ctx.debug, AFTER_PC, pc_after)
-
-    ctx.exec_sql_before_fh.close()
-    ctx.exec_sql_after_fh.close()
-
-    # Step 4: Write output to file
-    with open(ctx.output_file, 'w') as f:
-        f.write(pc_after)
-
-    vprint(ctx, 1, "File processed successfully: {0}".format(ctx.input_file))
+    pc_after = restore_exec_sql_blocks(state.c_after, state.segments, ctx)
+    # Keep the input's final newline, which the marker round trip drops.
+    if state.pc_before.endswith("\n") and not pc_after.endswith("\n"):
+        pc_after += "\n"
+    write_stage(ctx, AFTER_PC, pc_after)
+    state.pc_after = pc_after
+    close_debug(ctx)
+    return pc_after
+
+def close_debug(ctx):
+    """Flush the debug archive and close the debug files of ``ctx``."""
+    if ctx.debug_archive is not None:
+        ctx.debug_archive.flush()
+    if hasattr(ctx, 'exec_sql_before_fh'):
+        ctx.exec_sql_before_fh.close()
+        del ctx.exec_sql_before_fh
+    if hasattr(ctx, 'exec_sql_after_fh'):
+        ctx.exec_sql_after_fh.close()
+        del ctx.exec_sql_after_fh
 
 def format_exec_sql_block(lines, construct, ctx=None):
-    """Format EXEC SQL ``lines`` using ``sqlparse`` unless ORACLE."""
+    """Format EXEC SQL ``lines`` using ``sqlparse`` unless ORACLE.
+
+    Statements recognised by :func:`normalize_keywords` are cased
+    directly without running the ``sqlparse`` lexer.
+    """
     if not lines:
-        warn(ctx, "sqlparse: skipped - empty block")
+        report(ctx, "sqlparse: skipped - empty block", construct)
         return lines
     first = lines[0].lstrip()
     if first.startswith('EXEC ORACLE') or construct.startswith('ORACLE'):
-        warn(ctx, "sqlparse: skipped - ORACLE block")
+        report(ctx, "sqlparse: skipped - ORACLE block", construct)
         return lines
     if sqlparse is None:
-        warn(ctx, "sqlparse: skipped - sqlparse unavailable")
+        report(ctx, "sqlparse: skipped - sqlparse unavailable", construct)
         return lines
     match_indent = re_INDENT.match(lines[0])
     indent = match_indent.group(1)
     content = match_indent.group(2)
     m = re_EXEC_SQL.match(content)
     if not m:
-        warn(ctx, "sqlparse: skipped - pattern mismatch")
+        report(ctx, "sqlparse: skipped - pattern mismatch", construct)
         return lines
     rest = m.group(2) or ''
     sql_lines = []
@@ -174,16 +302,21 @@ def format_exec_sql_block(lines, construct, ctx=None):
     for line in lines[1:]:
         sql_lines.append(line.strip())
     sql_text = "\n".join(sql_lines)
-    vprint(ctx, 1, "sqlparse: formatting EXEC SQL block")
-    old_verbosity = getattr(sqlparse, 'verbosity', 0)
-    sqlparse.verbosity = getattr(ctx, 'verbose', 0)
-    try:
-        formatted = sqlparse.format(sql_text, keyword_case='upper')
-    except Exception as e:
-        warn(ctx, "sqlparse: skipped - sqlparse error: {0}".format(e))
-        return lines
-    finally:
-        sqlparse.verbosity = old_verbosity
+    # Simple fixed-shape statements only need their keywords upper-cased.
+    formatted = normalize_keywords(sql_text)
+    if formatted is not None:
+        vprint(ctx, 3, "sqlparse: fast path for EXEC SQL block")
+    else:
+        vprint(ctx, 1, "sqlparse: formatting EXEC SQL block")
+        old_verbosity = getattr(sqlparse, 'verbosity', 0)
+        sqlparse.verbosity = getattr(ctx, 'verbose', 0)
+        try:
+            formatted = sqlparse.format(sql_text, keyword_case='upper')
+        except Exception as e:
+            report(ctx, "sqlparse: skipped - sqlparse error", construct, str(e))
+            return lines
+        finally:
+            sqlparse.verbosity = old_verbosity
     formatted_lines = formatted.splitlines()
     output = []
     if formatted_lines:
@@ -194,6 +327,45 @@ def format_exec_sql_block(lines, construct, ctx=None):
         output = lines
     return output
 
+def write_segment(ctx, index, construct, details, stripped_line, block, formatted):
+    """Record captured segment ``index`` for debugging.
+
+    The segment is written beneath ``ctx.sql_dir`` when set and to
+    ``ctx.debug_archive`` when one is open.  The original ``block`` is
+    also appended to ``ctx.exec_sql_before_fh`` if open.
+    """
+    archive = getattr(ctx, 'debug_archive', None)
+    if archive is not None:
+        archive.write_segment(ctx.input_file, index, construct, details,
+                              stripped_line, block, formatted)
+    if getattr(ctx, 'sql_dir', None):
+        with open_file(ctx.sql_dir, "%03d" % index) as f:
+            if "end_pattern" in details:
+                f.write(("Construct:  '{0}'\n".format(construct))
+                       +("Pattern:    '{0}'\n".format(details["pattern"]))
+                       +("EndPattern: '{0}'\n\n".format(details["end_pattern"]))
+                       +("Stripped:  '{0}'\n\n".format(stripped_line))
+                       +("\n".join(block)+"\n\n"))
+            else:
+                f.write(("Construct:  '{0}'\n".format(construct))
+                       +("Pattern:    '{0}'\n\n".format(details["pattern"]))
+                       +("Stripped:   '{0}'\n\n".format(stripped_line))
+                       +("\n".join(block)+"\n\n"))
+    if hasattr(ctx, 'exec_sql_before_fh'):
+        ctx.exec_sql_before_fh.write("\n".join(block) + "\n= = = = =\n")
+
+class CaptureError(ValueError):
+    """Raised when capture meets a block end with no block to close.
+
+    ``line_number`` is the 1-based number of the offending ``line``.
+    """
+
+    def __init__(self, line_number, line):
+        ValueError.__init__(self, "Unaccompanied block end marker detected at line {0}:\n{1}"
+                            .format(line_number, line))
+        self.line_number = line_number
+        self.line = line
+
 def capture_exec_sql_blocks(ctx, lines, registry):
     """Extract EXEC SQL blocks from ``lines``.
 
@@ -202,26 +374,117 @@ def capture_exec_sql_blocks(ctx, lines, registry):
     ``(output_lines, captured_blocks)`` where ``output_lines`` is the
     marker substituted content and ``captured_blocks`` contains the
     original lines for each marker.
+
+    Captured blocks are passed through :func:`format_exec_sql_block`
+    unless ``ctx.format_sql`` is false.  When ``ctx.segments`` is a list
+    a ``(construct, line_number, terminated)`` tuple is appended to it
+    for every block, ``terminated`` being false for a multi-line block
+    still open at the end of ``lines``.
+
+    When ``ctx.coalesce`` is true, consecutive single-line statements
+    with the same indentation share one marker, whose segment holds all
+    of their lines.  ``BEGIN``/``END DECLARE SECTION`` lines always keep
+    a marker of their own so that their ``{``/``}`` prefixes still
+    indent the section body.
+
+    A block end without a block raises :class:`CaptureError`, unless
+    ``ctx.capture_errors`` is a list: the error is then appended to it
+    and capture continues with the line left in place.
+
+    When ``ctx.profile`` is a :class:`~proc_format.profiling.PatternProfile`
+    the time and matches of each registry pattern are recorded in it.
+    When ``ctx.segment_cache`` is a :class:`~proc_format.cache.SegmentCache`
+    blocks unchanged since the previous run on ``ctx.input_file`` reuse
+    their formatted lines instead of being formatted again.
     """
     captured_blocks = []
     output_lines = []
     inside_block = False
     current_block = []
     current_handler = None
+    current_entry = None
     current_construct = None
     current_stripped_line = None
-    marker_counter = 1  # Sequential counter for unique markers
+    current_line_number = None
+    format_sql = getattr(ctx, 'format_sql', True)
+    segments = getattr(ctx, 'segments', None)
+    coalesce = getattr(ctx, 'coalesce', False)
+    capture_errors = getattr(ctx, 'capture_errors', None)
+    # Single-line statements waiting to share a marker, as
+    # ``(construct, details, stripped_line, line, line_number)``.
+    pending = []
+
+    cache = getattr(ctx, 'segment_cache', None)
+    if cache is not None:
+        cached_segments = cache.previous(ctx.input_file)
+        current_segments = {}
+        reuse = [0, 0]      # hits, misses
+
+    def capture_block(construct, details, block, line_number, terminated=True):
+        if segments is not None:
+            segments.append((construct, line_number, terminated))
+        key = None
+        if cache is not None:
+            key = SegmentCache.key(construct, details, block, format_sql)
+            formatted = current_segments.get(key, cached_segments.get(key))
+            if formatted is not None:
+                current_segments[key] = formatted
+                reuse[0] += 1
+                return list(formatted)
+            reuse[1] += 1
+        captured = details["action"](block)
+        formatted = captured
+        if format_sql:
+            formatted = format_exec_sql_block(captured, construct, ctx)
+        # Blocks left unformatted with a warning are not kept, so that
+        # the warning is reported again on the next run.
+        if key is not None and (formatted is not captured or not format_sql):
+            current_segments[key] = list(formatted)
+        return formatted
+
+    def commit_segment(construct, details, stripped_line, block, line_number,
+                       terminated=True):
+        # Replace ``block`` with the next sequential marker.
+        marker_counter = len(captured_blocks) + 1
+        captured = capture_block(construct, details, block, line_number, terminated)
+        captured_blocks.append(captured)
+        write_segment(ctx, marker_counter, construct, details,
+                      stripped_line, block, captured)
+        marker = get_marker(marker_counter)
+        if "end_pattern" not in details:
+            if re.match(re_DECLARE_BEGIN, stripped_line):
+                marker = '{ ' + marker
+            if re.match(re_DECLARE_END, stripped_line):
+                marker = '} ' + marker
+        output_lines.append(marker)
+
+    def commit_pending():
+        # Replace the pending statements with a single marker.  The
+        # segment is recorded under the first statement's construct.
+        if len(pending) == 1:
+            construct, details, stripped_line, line, line_number = pending[0]
+            commit_segment(construct, details, stripped_line, [line], line_number)
+        elif pending:
+            marker_counter = len(captured_blocks) + 1
+            captured = []
+            for construct, details, stripped_line, line, line_number in pending:
+                captured.extend(capture_block(construct, details, [line], line_number))
+            captured_blocks.append(captured)
+            construct, details, stripped_line = pending[0][:3]
+            write_segment(ctx, marker_counter, construct, details, stripped_line,
+                          [item[3] for item in pending], captured)
+            output_lines.append(get_marker(marker_counter))
+        del pending[:]
 
     vprint(ctx, 1, "- Capture EXEC SQL segments ...")
     # Ensure specific patterns are matched before generic ones.  Python 3.2
-    # dictionaries do not preserve insertion order, so ``registry`` entries
-    # are sorted by the length of their pattern with longer (more specific)
+    # dictionaries do not preserve insertion order, so the compiled entries
+    # are ordered by the length of their pattern with longer (more specific)
     # patterns evaluated first.
-    registry_items = sorted(
-        registry.items(),
-        key=lambda item: len(item[1].get("pattern", "")),
-        reverse=True,
-    )
+    registry_items = compile_registry(registry)
+    profile = getattr(ctx, 'profile', None)
+    if profile is not None:
+        registry_items = profile.instrument(registry_items)
 
     for line_number, line in enumerate(lines, 1):
         stripped_line = line.strip()
@@ -229,90 +492,76 @@ def capture_exec_sql_blocks(ctx, lines, registry):
             current_block.append(line)  # Continue accumulating block
             # Detect the end of the current block using the handler's
             # ``end_pattern``.
-            if re.match(current_handler["end_pattern"], stripped_line):
+            if current_entry.end_pattern.match(stripped_line):
                 # Block has ended; replace it with a marker
-                marker = get_marker(marker_counter)
-                output_lines.append(marker)
-                captured = current_handler["action"](current_block)
-                captured_blocks.append(format_exec_sql_block(captured, current_construct, ctx))
-                with open_file(ctx.sql_dir, "%03d" % marker_counter) as f:
-                    f.write(("Construct:  '{}'\n".format(current_construct))
-                           +("Pattern:    '{}'\n".format(current_handler["pattern"]))
-                           +("EndPattern: '{}'\n\n".format(current_handler["end_pattern"]))
-                           +("Stripped:  '{}'\n\n".format(current_stripped_line))
-                           +("\n".join(current_block)+"\n\n"))
-                if hasattr(ctx, 'exec_sql_before_fh'):
-                    ctx.exec_sql_before_fh.write("\n".join(current_block) + "\n= = = = =\n")
-                marker_counter += 1
+                commit_segment(current_construct, current_handler,
+                               current_stripped_line, current_block,
+                               current_line_number)
                 inside_block = False
                 current_block = []  # Reset the block
                 current_handler = None
+                current_entry = None
                 current_construct = None
                 current_stripped_line = None
-                if getattr(ctx, 'verbose', 0) >= 2:
-                    print("b", end="")
+                current_line_number = None
         else:
-            for construct, details in registry_items:
-                if re.match(details["pattern"], stripped_line):
-                    if "error" in details:
-                        raise ValueError("Unaccompanied block end marker detected at line {0}:\n{1}"
-                            .format(line_number, line))
-                    if "end_pattern" in details:
+            for entry in registry_items:
+                if entry.pattern.match(stripped_line):
+                    construct, details = entry.name, entry.details
+                    if entry.error:
+                        if capture_errors is None:
+                            raise CaptureError(line_number, line)
+                        # The line is kept as is and capture continues.
+                        commit_pending()
+                        capture_errors.append(CaptureError(line_number, line))
+                        output_lines.append(line)
+                        break
+                    if entry.end_pattern is not None:
                         # Multi-line block detected
+                        commit_pending()
                         inside_block = True
                         current_block = [line]
                         current_handler = details
+                        current_entry = entry
                         current_construct = construct
                         current_stripped_line = stripped_line
+                        current_line_number = line_number
+                    elif coalesce and not (re.match(re_DECLARE_BEGIN, stripped_line)
+                                           or re.match(re_DECLARE_END, stripped_line)):
+                        # Single-line match joining the pending run when
+                        # indented alike
+                        if pending and re_INDENT.match(pending[0][3]).group(1) \
+                                != re_INDENT.match(line).group(1):
+                            commit_pending()
+                        pending.append((construct, details, stripped_line, line, line_number))
                     else:
                         # Single-line match
-                        captured = details["action"]([line])
-                        captured_blocks.append(format_exec_sql_block(captured, construct, ctx))
-                        with open_file(ctx.sql_dir, "%03d" % marker_counter) as f:
-                            f.write(("Construct:  '{}'\n".format(construct))
-                                   +("Pattern:    '{}'\n\n".format(details["pattern"]))
-                                   +("Stripped:   '{}'\n\n".format(stripped_line))
-                                   +(line)+"\n\n")
-                        if hasattr(ctx, 'exec_sql_before_fh'):
-                            ctx.exec_sql_before_fh.write(line + "\n= = = = =\n")
-                        marker = get_marker(marker_counter)
-                        if re.match(re_DECLARE_BEGIN, stripped_line):
-                            marker = '{ ' + marker
-                        if re.match(re_DECLARE_END, stripped_line):
-                            marker = '} ' + marker
-                        output_lines.append(marker)
-                        marker_counter += 1
-                        if getattr(ctx, 'verbose', 0) >= 2:
-                            print("s", end="")
+                        commit_pending()
+                        commit_segment(construct, details, stripped_line,
+                                       [line], line_number)
                     break
             else:
+                commit_pending()
                 output_lines.append(line)
-    if getattr(ctx, 'verbose', 0) >= 2:
-        print()
 
+    commit_pending()
     if inside_block:
-        marker = get_marker(marker_counter)
-        output_lines.append(marker)
-        captured = current_handler["action"](current_block)
-        captured_blocks.append(format_exec_sql_block(captured, current_construct, ctx))
-        with open_file(ctx.sql_dir, "%03d" % marker_counter) as f:
-            f.write(("Construct:  '{0}'\n".format(current_construct))
-                   +("Pattern:    '{0}'\n".format(current_handler["pattern"]))
-                   +("EndPattern: '{0}'\n\n".format(current_handler["end_pattern"]))
-                   +("Stripped:  '{0}'\n\n".format(current_stripped_line))
-                   +("\n".join(current_block)+"\n\n"))
-        if hasattr(ctx, 'exec_sql_before_fh'):
-            ctx.exec_sql_before_fh.write("\n".join(current_block) + "\n= = = = =\n")
-        marker_counter += 1
-        if getattr(ctx, 'verbose', 0) >= 2:
-            print("b", end="")
+        commit_segment(current_construct, current_handler,
+                       current_stripped_line, current_block,
+                       current_line_number, terminated=False)
+    vprint(ctx, 2, "  {0} segments captured".format(len(captured_blocks)))
+    if cache is not None:
+        cache.store(ctx.input_file, current_segments, reuse[0], reuse[1])
+        vprint(ctx, 2, "  {0} segments reused".format(reuse[0]))
 
     return output_lines, captured_blocks
 
 def format_with_clang(ctx, content):
     """Return ``content`` formatted with ``clang-format``.
 
-    ``ctx.clang_format_path`` is executed as a subprocess.  Any
+    ``ctx.clang_format_path`` is executed as a subprocess through the
+    process-wide :class:`~proc_format.scheduler.ClangFormatScheduler`,
+    which bounds concurrency and kills runs exceeding its timeout.  Any
     ``clang-format`` failure results in ``RuntimeError``.  On Python
     versions earlier than 3.7 the function encodes the input to bytes
     to satisfy ``subprocess``'s expectations.
@@ -325,11 +574,9 @@ def format_with_clang(ctx, content):
         # Python 3.2 subprocess expects byte strings
         if hasattr(content, "encode"):
             content = content.encode()
-    process = subprocess.Popen([ctx.clang_format_path],
-            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-            **popen_additional_args)
-    output, error = process.communicate(input=content)
-    if process.returncode != 0:
+    output, error, returncode = get_scheduler().run(
+        [ctx.clang_format_path], content, **popen_additional_args)
+    if returncode != 0:
         raise RuntimeError("Clang-format failed: {0}".format(error))
     if sys.version_info < (3, 7, 0):
         output = output.decode()
@@ -339,10 +586,10 @@ def restore_exec_sql_blocks(content, exec_sql_segments, ctx=None):
     """Replace markers in ``content`` with EXEC SQL blocks.
 
     ``exec_sql_segments`` must contain the original text for each marker
-    in order.  Restored lines are indented to match the marker they
-    replace.  Errors are raised for out-of-sequence markers or when not
-    all segments are consumed.  ``ctx`` is optional and used only for
-    debugging output.
+    in order; it is not modified.  Restored lines are indented to match
+    the marker they replace.  Errors are raised for out-of-sequence
+    markers or when not all segments are consumed.  ``ctx`` is optional
+    and used only for debugging output.
     """
     lines = content.split('\n')
     restored_lines = []
@@ -351,36 +598,37 @@ def restore_exec_sql_blocks(content, exec_sql_segments, ctx=None):
     vprint(ctx, 1, "- Restore EXEC SQL segments ...")
 
     for line in lines:
-        match = re_MARKER_PREFIX.match(line.strip())
+        # Every marker contains ``MARKER_WORD``; the substring test spares
+        # the regular expression for all other lines.
+        match = MARKER_WORD in line and re_MARKER_PREFIX.match(line.strip())
         if match:
             try:
                 marker_number = int(match.group(2))
                 if marker_number != expected_marker:
                     raise ValueError("Marker out of sequence: expected {0}, found {1}"
                                         .format(expected_marker, marker_number))
-                lines = exec_sql_segments[marker_number - 1]
+                segment = exec_sql_segments[marker_number - 1]
                 if ctx is not None and hasattr(ctx, 'exec_sql_after_fh'):
-                    ctx.exec_sql_after_fh.write("\n".join(lines) + "\n= = = = =\n")
+                    ctx.exec_sql_after_fh.write("\n".join(segment) + "\n= = = = =\n")
                 indent = len(line) - len(line.lstrip())
-                first = lines.pop(0)
-                restored_lines.append(" " * indent + first.lstrip())
-                if len(lines) > 0:
-                    prior_indent = len(first) - len(first.lstrip())
-                    delta = indent - prior_indent
-                    (more, less) = (0, delta) if delta < 0 else (delta, 0)
-                    for line in lines:
-                        restored_lines.append(" " * more + line[-less:])
+                first = segment[0]
+                first_stripped = first.lstrip()
+                restored_lines.append(" " * indent + first_stripped)
+                if len(segment) > 1:
+                    delta = indent - (len(first) - len(first_stripped))
+                    if delta < 0:
+                        restored_lines.extend([line[-delta:] for line in segment[1:]])
+                    else:
+                        more = " " * delta
+                        restored_lines.extend([more + line for line in segment[1:]])
                 expected_marker += 1
-                if getattr(ctx, 'verbose', 0) >= 2:
-                    print(".", end="")
             except (IndexError, ValueError) as e:
                 raise ValueError("Invalid or missing marker: {0}, Error: {1}"
                                     .format(line, e))
         else:
             restored_lines.append(line)
 
-    if getattr(ctx, 'verbose', 0) >= 2:
-        print()
+    vprint(ctx, 2, "  {0} segments restored".format(expected_marker - 1))
 
     remaining = len(exec_sql_segments) - expected_marker + 1
     if remaining > 0:
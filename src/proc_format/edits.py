@@ -0,0 +1,241 @@
+"""Minimal text edits between an editor buffer and its formatted form.
+
+Editors that replace the whole buffer with the formatter's output lose
+markers and undo granularity.  The helpers here compare the buffer with
+the output of :func:`proc_format.core.format_content` and describe the
+difference as a short list of replacements that an editor can apply in
+place.
+
+Lines are numbered from 1 and split at ``\\n`` only.  Columns are
+character offsets within the line, counted from 0; a tab counts as one
+character, so they are not display columns.  The position just past a
+final newline is the start of the line after the last one.  Each edit
+replaces the text between ``start`` (inclusive) and ``end`` (exclusive)
+of the *original* buffer with ``text``.  Edits are returned in buffer
+order and never overlap, so applying them from last to first keeps
+earlier positions valid.
+
+Lines are matched in the manner of a patience diff: lines occurring
+exactly once on both sides anchor the match and the gaps between
+anchors are matched recursively.  The cost stays close to linear in the
+buffer size even where lines such as ``{``, ``}`` and blank lines repeat
+throughout.
+"""
+
+import bisect
+import difflib
+
+# Gaps without anchors are matched with ``difflib`` in windows of this
+# many lines on each side, which bounds its quadratic cost.
+WINDOW = 64
+
+
+def _split_lines(text):
+    """Return the lines of ``text`` with their ``\\n`` terminators."""
+    parts = text.split('\n')
+    lines = [part + '\n' for part in parts[:-1]]
+    if parts[-1]:
+        lines.append(parts[-1])
+    return lines
+
+
+def _line_offsets(lines):
+    """Return the starting character offset of each line in ``lines``.
+
+    One extra entry holds the total length so that ``offsets[i + 1]``
+    is always the end of line ``i``.
+    """
+    offsets = [0]
+    for line in lines:
+        offsets.append(offsets[-1] + len(line))
+    return offsets
+
+
+def _position(offsets, offset, terminated):
+    """Return the ``{"line", "column"}`` position of ``offset``.
+
+    ``terminated`` tells whether the text ends with a newline, in which
+    case its end lies on the line after the last one.
+    """
+    index = bisect.bisect_right(offsets, offset) - 1
+    if not terminated:
+        index = min(index, max(len(offsets) - 2, 0))
+    return {"line": index + 1, "column": offset - offsets[index]}
+
+
+def _unique_pairs(a, a1, a2, b, b1, b2):
+    # Return (i, j) for lines occurring once in a[a1:a2] and b[b1:b2].
+    counts = {}
+    for i in range(a1, a2):
+        entry = counts.get(a[i])
+        counts[a[i]] = [i, None] if entry is None else [-1, None]
+    for j in range(b1, b2):
+        entry = counts.get(b[j])
+        if entry is not None and entry[0] >= 0:
+            entry[1] = j if entry[1] is None else -1
+    return sorted((i, j) for i, j in counts.values()
+                  if i >= 0 and j is not None and j >= 0)
+
+
+def _longest_increasing(pairs):
+    # Longest subsequence of ``pairs`` (sorted by i) increasing in j.
+    tails = []          # j of the smallest tail of each length
+    tail_index = []
+    previous = [None] * len(pairs)
+    for k, (i, j) in enumerate(pairs):
+        length = bisect.bisect_left(tails, j)
+        if length == len(tails):
+            tails.append(j)
+            tail_index.append(k)
+        else:
+            tails[length] = j
+            tail_index[length] = k
+        previous[k] = tail_index[length - 1] if length else None
+    result = []
+    k = tail_index[-1] if tail_index else None
+    while k is not None:
+        result.append(pairs[k])
+        k = previous[k]
+    result.reverse()
+    return result
+
+
+def _window_matches(a, a1, a2, b, b1, b2):
+    # Match a[a1:a2] and b[b1:b2] with difflib, one window at a time.
+    # Pairs in the first half of a window are kept and the next window
+    # starts after them, so that a match is never cut off at a window's
+    # far edge.
+    matches = []
+    half = WINDOW // 2
+    while a1 < a2 and b1 < b2:
+        wa, wb = min(a2, a1 + WINDOW), min(b2, b1 + WINDOW)
+        last = wa == a2 and wb == b2
+        matcher = difflib.SequenceMatcher(None, a[a1:wa], b[b1:wb], autojunk=False)
+        pairs = [(a1 + i + k, b1 + j + k)
+                 for i, j, size in matcher.get_matching_blocks() for k in range(size)]
+        if not pairs:
+            a1, b1 = wa, wb
+            continue
+        if not last:
+            kept = [(i, j) for i, j in pairs if i < a1 + half and j < b1 + half]
+            pairs = kept or pairs[:1]
+        matches.extend(pairs)
+        if last:
+            break
+        a1, b1 = pairs[-1][0] + 1, pairs[-1][1] + 1
+    return matches
+
+
+def _matching_lines(a, b, a1=0, a2=None, b1=0, b2=None):
+    """Return the sorted ``(i, j)`` pairs of matching lines of ``a`` and ``b``."""
+    matches = []
+    stack = [(a1, len(a) if a2 is None else a2, b1, len(b) if b2 is None else b2)]
+    while stack:
+        a1, a2, b1, b2 = stack.pop()
+        while a1 < a2 and b1 < b2 and a[a1] == b[b1]:
+            matches.append((a1, b1))
+            a1 += 1
+            b1 += 1
+        while a1 < a2 and b1 < b2 and a[a2 - 1] == b[b2 - 1]:
+            a2 -= 1
+            b2 -= 1
+            matches.append((a2, b2))
+        if a1 == a2 or b1 == b2:
+            continue
+        anchors = _longest_increasing(_unique_pairs(a, a1, a2, b, b1, b2))
+        if not anchors:
+            matches.extend(_window_matches(a, a1, a2, b, b1, b2))
+            continue
+        for i, j in anchors:
+            matches.append((i, j))
+            stack.append((a1, i, b1, j))
+            a1, b1 = i + 1, j + 1
+        stack.append((a1, a2, b1, b2))
+    matches.sort()
+    return matches
+
+
+def _hunks(matches, a1, a2, b1, b2):
+    # Yield the (i1, i2, j1, j2) spans between the ``matches``.
+    i, j = a1, b1
+    for mi, mj in matches + [(a2, b2)]:
+        if mi > i or mj > j:
+            yield i, mi, j, mj
+        i, j = mi + 1, mj + 1
+
+
+def _window(a, b, first, last):
+    """Return the spans of ``a`` and ``b`` enclosing lines ``first``-``last`` of ``a``.
+
+    The spans are bounded by the nearest lines, outside the region, that
+    occur exactly once in both texts and in the same order.
+    """
+    anchors = _longest_increasing(_unique_pairs(a, 0, len(a), b, 0, len(b)))
+    a1 = b1 = 0
+    a2, b2 = len(a), len(b)
+    for i, j in anchors:
+        if i < first - 1:
+            a1, b1 = i, j
+        elif i > last - 1:
+            a2, b2 = i + 1, j + 1
+            break
+    return a1, a2, b1, b2
+
+
+def compute_edits(before, after, region=None):
+    """Return the edits that turn the text ``before`` into ``after``.
+
+    Changed lines are located with a patience-style line diff and each
+    hunk is then trimmed of its common leading and trailing characters
+    so that only the differing text is replaced.
+
+    ``region`` is an optional ``(first_line, last_line)`` pair of
+    1-based, inclusive line numbers in ``before``.  When given, only the
+    part of the texts between the nearest unchanged anchor lines around
+    the region is compared, and only edits touching those lines are
+    returned.
+    """
+    a = _split_lines(before)
+    b = _split_lines(after)
+    offsets = _line_offsets(a)
+    terminated = before.endswith('\n')
+    if region is not None:
+        a1, a2, b1, b2 = _window(a, b, region[0], region[1])
+    else:
+        a1, a2, b1, b2 = 0, len(a), 0, len(b)
+    edits = []
+    for i1, i2, j1, j2 in _hunks(_matching_lines(a, b, a1, a2, b1, b2), a1, a2, b1, b2):
+        if region is not None:
+            first, last = region
+            # Pure insertions occupy no lines; treat them as touching
+            # the line they are inserted before.
+            if max(i2, i1 + 1) < first or i1 + 1 > last:
+                continue
+        old = "".join(a[i1:i2])
+        new = "".join(b[j1:j2])
+        prefix = 0
+        limit = min(len(old), len(new))
+        while prefix < limit and old[prefix] == new[prefix]:
+            prefix += 1
+        suffix = 0
+        limit -= prefix
+        while suffix < limit and old[-1 - suffix] == new[-1 - suffix]:
+            suffix += 1
+        start = offsets[i1] + prefix
+        end = offsets[i2] - suffix
+        edits.append({
+            "start": _position(offsets, start, terminated),
+            "end": _position(offsets, end, terminated),
+            "text": new[prefix:len(new) - suffix],
+        })
+    return edits
+
+
+def apply_edits(text, edits):
+    """Return ``text`` with ``edits`` from :func:`compute_edits` applied."""
+    offsets = _line_offsets(_split_lines(text))
+    for edit in reversed(edits):
+        start = offsets[edit["start"]["line"] - 1] + edit["start"]["column"]
+        end = offsets[edit["end"]["line"] - 1] + edit["end"]["column"]
+        text = text[:start] + edit["text"] + text[end:]
+    return text
@@ -0,0 +1,70 @@
+"""Aggregated warning events.
+
+Formatting warnings such as "sqlparse: skipped - ORACLE block" occur
+once per EXEC SQL block.  Printing each of them costs a line of
+unbuffered terminal output per block, which adds up over thousands of
+files.  When a context carries an :class:`EventCollector` the warnings
+are counted by reason and construct instead, summarised per file and
+per run, and optionally streamed in full to a JSON Lines file.
+"""
+
+import json
+import threading
+
+
+class EventCollector(object):
+    """Count warning events and optionally stream them to ``stream_path``."""
+
+    def __init__(self, stream_path=None):
+        self._lock = threading.Lock()
+        self.counts = {}        # (reason, construct) -> count
+        self.file_counts = {}   # file -> {(reason, construct): count}
+        self.stream = open(stream_path, 'a') if stream_path else None
+
+    def add(self, reason, construct=None, file_name=None, detail=None):
+        """Record one event of ``reason`` for ``construct`` in ``file_name``."""
+        key = (reason, construct)
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+            per_file = self.file_counts.setdefault(file_name, {})
+            per_file[key] = per_file.get(key, 0) + 1
+            if self.stream is not None:
+                record = {"reason": reason, "construct": construct,
+                          "file": file_name}
+                if detail is not None:
+                    record["detail"] = detail
+                self.stream.write(json.dumps(record, sort_keys=True) + "\n")
+
+    def total(self, file_name=None):
+        """Return the number of events, in ``file_name`` if given."""
+        with self._lock:
+            counts = self.counts if file_name is None else self.file_counts.get(file_name, {})
+            return sum(counts.values())
+
+    def summary(self, file_name=None):
+        """Return summary lines grouping events by reason and construct.
+
+        Only events of ``file_name`` are included when it is given.
+        """
+        with self._lock:
+            counts = self.counts if file_name is None else self.file_counts.get(file_name, {})
+            counts = dict(counts)
+        reasons = {}
+        for (reason, construct), count in counts.items():
+            reasons.setdefault(reason, []).append((construct, count))
+        lines = []
+        for reason in sorted(reasons):
+            constructs = sorted(reasons[reason], key=lambda item: (-item[1], str(item[0])))
+            total = sum(count for construct, count in constructs)
+            detail = ", ".join("{0}: {1}".format(construct, count)
+                               for construct, count in constructs if construct is not None)
+            if detail:
+                lines.append("{0}: {1} ({2})".format(reason, total, detail))
+            else:
+                lines.append("{0}: {1}".format(reason, total))
+        return lines
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
@@ -0,0 +1,81 @@
+"""Fast keyword casing for simple EXEC SQL statements.
+
+Most captured statements are short and fixed in shape: ``COMMIT WORK
+RELEASE``, ``WHENEVER SQLERROR GOTO label``, ``CONNECT :u IDENTIFIED BY
+:p``, ``OPEN c`` and the like.  Running each of them through the full
+``sqlparse`` lexer and filter stack is needlessly slow.
+
+:func:`normalize_keywords` recognises these statement families with one
+precompiled pattern and upper-cases their keywords directly.  Whether a
+word is a keyword is decided by ``sqlparse``'s own keyword tables, so
+the result is identical to ``sqlparse.format(text, keyword_case='upper')``
+for every statement accepted.  Anything else, including any statement
+with literals, comments, parentheses or qualified names, is left to
+``sqlparse``.
+"""
+
+import re
+
+try:
+    from sqlparse import tokens as _tokens
+    from sqlparse.lexer import Lexer as _Lexer
+    _is_keyword = _Lexer.get_default_instance().is_keyword
+except (ImportError, AttributeError):  # pragma: no cover - sqlparse optional
+    _is_keyword = None
+
+# Statement families handled without sqlparse.  Words are ASCII only;
+# ``GO TO`` is excluded because sqlparse rewrites it to ``GOTO``.
+re_FAST_STATEMENT = re.compile(r"""
+    (?: (?:COMMIT|ROLLBACK) (?:\s+WORK)? (?:\s+RELEASE)?
+      | WHENEVER \s+ (?:SQLERROR|SQLWARNING|NOT\s+FOUND)
+                 \s+ (?:CONTINUE|STOP|GOTO\s+(?P<label>[A-Za-z_]\w*)|DO\s+BREAK|DO\s+CONTINUE)
+      | CONNECT \s+ :[A-Za-z_]\w* (?:\s+IDENTIFIED\s+BY\s+:[A-Za-z_]\w*)?
+                (?:\s+USING\s+:[A-Za-z_]\w*)?
+      | (?:OPEN|CLOSE|INCLUDE) \s+ (?P<name>[A-Za-z_]\w*)
+      | (?:BEGIN|END) \s+ DECLARE \s+ SECTION
+    ) \s* ;? \s* \Z
+    """, re.IGNORECASE | re.VERBOSE)
+
+re_FAST_WORD = re.compile(r"(?<![:\w])[A-Za-z_]\w*")
+
+# Words that sqlparse classifies by pattern rather than by keyword
+# table lookup, and ``GO``, which it lexes as a batch separator and
+# whose following whitespace it drops.  Statements using them as names
+# are left to sqlparse.
+PATTERN_WORDS = frozenset([
+    "AS", "ASC", "CASE", "CREATE", "DESC", "END", "FROM", "GO", "ILIKE",
+    "IN", "JOIN", "LIKE", "REGEXP", "RLIKE", "USING", "VALUES",
+])
+
+# Casing per distinct word; cursor and label names keep this small.
+_word_cache = {}
+_WORD_CACHE_LIMIT = 10000
+
+def _case_word(match):
+    word = match.group(0)
+    try:
+        return _word_cache[word]
+    except KeyError:
+        pass
+    ttype = _is_keyword(word)[0]
+    cased = word.upper() if ttype in _tokens.Keyword else word
+    if len(_word_cache) >= _WORD_CACHE_LIMIT:
+        _word_cache.clear()
+    _word_cache[word] = cased
+    return cased
+
+def normalize_keywords(sql_text):
+    """Return ``sql_text`` with its keywords upper-cased, or ``None``.
+
+    ``None`` means the statement is not one of the simple families
+    handled here and must be formatted by ``sqlparse``.
+    """
+    if _is_keyword is None:
+        return None
+    m = re_FAST_STATEMENT.match(sql_text)
+    if not m:
+        return None
+    name = m.group('label') or m.group('name')
+    if name is not None and name.upper() in PATTERN_WORDS:
+        return None
+    return re_FAST_WORD.sub(_case_word, sql_text)
@@ -0,0 +1,81 @@
+"""Pipelined execution of the formatting stages over many inputs.
+
+Formatting a file is three steps: capture (Python), ``clang-format`` (a
+subprocess) and restore (Python).  Run one file after another, the
+subprocess sits idle while Python works and the reverse.
+:func:`run_pipeline` gives each stage its own thread, joined by bounded
+queues, so that capture of file N+1 runs while ``clang-format`` works on
+file N and restore handles file N-1.  Throughput then approaches that of
+the slowest stage instead of the sum of all three.
+
+Waiting on ``clang-format`` releases the GIL, which is what lets the
+Python stages proceed in the meantime.
+"""
+
+import queue
+import threading
+
+DEFAULT_QUEUE_SIZE = 4
+
+_DONE = object()
+
+
+class StageError(object):
+    """Placeholder passed down the pipeline for an item that failed.
+
+    ``stage`` is the index of the failing stage and ``error`` the
+    exception it raised.
+    """
+
+    __slots__ = ["item", "stage", "error"]
+
+    def __init__(self, item, stage, error):
+        self.item = item
+        self.stage = stage
+        self.error = error
+
+
+def _feed(items, output):
+    for item in items:
+        output.put(item)
+    output.put(_DONE)
+
+
+def _work(index, stage, source, output):
+    while True:
+        value = source.get()
+        if value is _DONE:
+            output.put(_DONE)
+            return
+        if not isinstance(value, StageError):
+            try:
+                value = stage(value)
+            except Exception as e:
+                value = StageError(value, index, e)
+        output.put(value)
+
+
+def run_pipeline(items, stages, queue_size=DEFAULT_QUEUE_SIZE):
+    """Yield the result of passing each of ``items`` through ``stages``.
+
+    Each stage is a callable taking the previous stage's result and runs
+    in its own thread; at most ``queue_size`` results wait between two
+    stages.  Results are yielded in the order of ``items``.  An item
+    whose stage raised is yielded as a :class:`StageError` and skips the
+    remaining stages.
+    """
+    queues = [queue.Queue(queue_size) for _ in range(len(stages) + 1)]
+    threads = [threading.Thread(target=_feed, args=(items, queues[0]))]
+    for index, stage in enumerate(stages):
+        threads.append(threading.Thread(target=_work,
+                                        args=(index, stage, queues[index], queues[index + 1])))
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    while True:
+        value = queues[-1].get()
+        if value is _DONE:
+            break
+        yield value
+    for thread in threads:
+        thread.join()
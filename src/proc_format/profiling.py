@@ -0,0 +1,164 @@
+"""Cost of the registry patterns, per construct.
+
+Every line outside a block is matched against the registry patterns in
+turn, and every line inside a multi-line block against its
+``end_pattern``.  A single slow pattern from an ``.exec-sql-parser``
+file, for instance one prone to catastrophic backtracking, therefore
+slows every line of every file.
+
+A :class:`PatternProfile` carried by a context as ``ctx.profile``
+records the calls, matches and time of each ``pattern`` and
+``end_pattern`` used by :func:`~proc_format.core.capture_exec_sql_blocks`.
+:func:`benchmark_configs` measures the patterns of the default registry
+and of each ``.exec-sql-parser`` file against a sample corpus, without
+formatting anything.
+"""
+
+import re
+import time
+import threading
+
+from .registry import DEFAULT_COMPILED_REGISTRY
+
+# Python 3.2 has no ``perf_counter``.
+_clock = getattr(time, 'perf_counter', time.time)
+
+DEFAULT_CONFIG = "<default>"
+PATTERN_KINDS = ("pattern", "end_pattern")
+
+
+class TimedPattern(object):
+    """Stand-in for a compiled pattern that times its ``match`` calls."""
+
+    __slots__ = ["profile", "key", "regex"]
+
+    def __init__(self, profile, key, regex):
+        self.profile = profile
+        self.key = key
+        self.regex = regex
+
+    def match(self, text):
+        start = _clock()
+        m = self.regex.match(text)
+        self.profile.add(self.key, _clock() - start, m is not None)
+        return m
+
+
+class ProfiledEntry(object):
+    """A :class:`~proc_format.registry.CompiledEntry` with timed patterns."""
+
+    __slots__ = ["name", "details", "pattern", "end_pattern", "error"]
+
+    def __init__(self, profile, entry):
+        self.name = entry.name
+        self.details = entry.details
+        self.pattern = TimedPattern(profile, (entry.name, "pattern"), entry.pattern)
+        self.end_pattern = None
+        if entry.end_pattern is not None:
+            self.end_pattern = TimedPattern(profile, (entry.name, "end_pattern"),
+                                            entry.end_pattern)
+        self.error = entry.error
+
+
+class PatternProfile(object):
+    """Calls, matches and seconds per ``(construct, kind)`` pattern."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stats = {}     # (construct, kind) -> [calls, matches, seconds]
+
+    def instrument(self, entries):
+        """Return compiled registry ``entries`` recording into this profile."""
+        return tuple(ProfiledEntry(self, entry) for entry in entries)
+
+    def add(self, key, seconds, matched):
+        with self._lock:
+            stats = self.stats.get(key)
+            if stats is None:
+                stats = self.stats[key] = [0, 0, 0.0]
+            stats[0] += 1
+            stats[1] += matched
+            stats[2] += seconds
+
+    def top(self, limit=None):
+        """Return the pattern statistics, most expensive first.
+
+        Each item is a dictionary with ``construct``, ``kind``,
+        ``calls``, ``matches`` and ``seconds``.
+        """
+        with self._lock:
+            items = [(key, list(stats)) for key, stats in self.stats.items()]
+        items.sort(key=lambda item: (-item[1][2], item[0]))
+        result = [{"construct": construct, "kind": kind, "calls": calls,
+                   "matches": matches, "seconds": round(seconds, 6)}
+                  for (construct, kind), (calls, matches, seconds) in items]
+        return result[:limit] if limit is not None else result
+
+    def report(self, limit=10):
+        """Return the :meth:`top` patterns as report lines."""
+        lines = []
+        for item in self.top(limit):
+            lines.append("{seconds:10.6f}s {calls:8d} calls {matches:6d} matches  "
+                         "{construct} ({kind})".format(**item))
+        return lines
+
+
+def config_patterns(configs):
+    """Return ``(config, construct, kind, pattern)`` for the patterns of ``configs``.
+
+    ``configs`` is a list of ``(path, data)`` pairs as returned by
+    :func:`~proc_format.registry.find_configs`.  The entries of the
+    default registry come first under :data:`DEFAULT_CONFIG`.
+    """
+    patterns = []
+    for entry in DEFAULT_COMPILED_REGISTRY:
+        for kind in PATTERN_KINDS:
+            if kind in entry.details:
+                patterns.append((DEFAULT_CONFIG, entry.name, kind, entry.details[kind]))
+    for path, data in configs:
+        for name in sorted(data):
+            value = data[name]
+            if not isinstance(value, dict) or value.get('pattern') is None:
+                continue
+            for kind in PATTERN_KINDS:
+                if kind in value:
+                    patterns.append((path, name, kind, value[kind]))
+    return patterns
+
+
+def benchmark_configs(configs, lines, repeat=1, progress=None):
+    """Time the patterns of ``configs`` over the stripped corpus ``lines``.
+
+    Every pattern is matched against every line ``repeat`` times.  The
+    result lists a dictionary per pattern with ``config``,
+    ``construct``, ``kind``, ``pattern``, ``matches``, ``seconds`` and
+    ``us_per_line``, slowest first; a pattern that fails to compile has
+    an ``error`` instead of timings.  ``progress``, when given, is called
+    with each result's key before the pattern is run, which names the
+    culprit should a pattern never finish.
+    """
+    results = []
+    for config, construct, kind, pattern in config_patterns(configs):
+        result = {"config": config, "construct": construct, "kind": kind,
+                  "pattern": pattern}
+        results.append(result)
+        if progress is not None:
+            progress(result)
+        try:
+            match = re.compile(pattern).match
+        except (re.error, TypeError) as e:
+            result["error"] = str(e)
+            continue
+        matches = 0
+        start = _clock()
+        for _ in range(repeat):
+            for line in lines:
+                if match(line):
+                    matches += 1
+        seconds = _clock() - start
+        result["matches"] = matches // repeat
+        result["seconds"] = round(seconds / repeat, 6)
+        calls = len(lines) * repeat
+        result["us_per_line"] = round(seconds * 1e6 / calls, 3) if calls else 0.0
+    results.sort(key=lambda result: -result.get("seconds", float("inf")))
+    return results
@@ -40,6 +40,7 @@ regular expression patterns and optional handlers.
 
 import os
 import re
+import sys
 import json
 
 re_EXEC_SQL  = re.compile(r'EXEC\s+SQL\b(\s*(.*))?')
@@ -150,17 +151,90 @@ DEFAULT_EXEC_SQL_REGISTRY = {
     }
 }
 
-def load_registry(start_dir, search_parents=True, verbose=0):
-    """Load EXEC SQL patterns starting at ``start_dir``.
+def keep_lines(lines):
+    """Default ``action``: maintain the original content."""
+    return lines
 
-    Configuration files named ``.exec-sql-parser`` are read from
-    ``start_dir`` and optionally its ancestors.  Each file may add or
-    remove entries from the default registry.  When ``search_parents`` is
-    ``False`` only the starting directory is considered.
+class CompiledEntry(object):
+    """A registry entry with its patterns compiled.
+
+    ``end_pattern`` is ``None`` for single-line constructs and ``error``
+    tells whether a match is a capture error.
+    """
+
+    __slots__ = ["name", "details", "pattern", "end_pattern", "error"]
+
+    def __init__(self, name, details):
+        self.name = name
+        self.details = details
+        self.pattern = compile_pattern(details["pattern"])
+        self.end_pattern = None
+        if "end_pattern" in details:
+            self.end_pattern = compile_pattern(details["end_pattern"])
+        self.error = "error" in details
+
+# Compiled patterns shared by every registry, keyed by pattern text.
+_pattern_cache = {}
+
+def compile_pattern(pattern):
+    """Return ``pattern`` compiled, reusing earlier compilations."""
+    try:
+        return _pattern_cache[pattern]
+    except KeyError:
+        compiled = _pattern_cache[pattern] = re.compile(pattern)
+        return compiled
+
+# Duplicate entries only work around the Python 3.2.5 bug noted above.
+DEDUPLICATE = sys.version_info >= (3, 9)
+
+# Compiled registries keyed by their content, see ``compile_registry``.
+_compiled_cache = {}
+_COMPILED_CACHE_LIMIT = 64
+
+def compile_registry(registry):
+    """Return the entries of ``registry`` compiled and in match order.
+
+    Longer (more specific) patterns are tried first; entries with equal
+    pattern lengths keep their order in ``registry``.  Where the Python
+    3.2.5 bug does not apply, entries repeating an earlier entry's
+    patterns are dropped, as they could never match first.  The result
+    is a tuple of :class:`CompiledEntry` and is cached, so registries
+    with the same entries share one compiled snapshot.
+    """
+    key = tuple((name, details.get("pattern"), details.get("end_pattern"),
+                 "error" in details, details.get("action"))
+                for name, details in registry.items())
+    try:
+        return _compiled_cache[key]
+    except (KeyError, TypeError):
+        pass
+    items = sorted(registry.items(),
+                   key=lambda item: len(item[1].get("pattern", "")),
+                   reverse=True)
+    entries = []
+    seen = set()
+    for name, details in items:
+        signature = (details["pattern"], details.get("end_pattern"), "error" in details)
+        if DEDUPLICATE and signature in seen:
+            continue
+        seen.add(signature)
+        entries.append(CompiledEntry(name, details))
+    entries = tuple(entries)
+    try:
+        if len(_compiled_cache) >= _COMPILED_CACHE_LIMIT:
+            _compiled_cache.clear()
+        _compiled_cache[key] = entries
+    except TypeError:  # unhashable custom entries are not cached
+        pass
+    return entries
+
+def find_configs(start_dir, search_parents=True):
+    """Return the ``(path, data)`` of the ``.exec-sql-parser`` files in effect.
+
+    Files are listed from the outermost to ``start_dir``, the order in
+    which :func:`load_registry` applies them.  Unreadable files count as
+    empty.
     """
-    if verbose >= 1:
-        print('Loading default configuration options')
-    registry = DEFAULT_EXEC_SQL_REGISTRY.copy()
     path = os.path.abspath(start_dir)
     configs = []
     while True:
@@ -180,7 +254,20 @@ def load_registry(start_dir, search_parents=True, verbose=0):
             break
         path = parent
     configs.reverse()
-    for cfg_path, data in configs:
+    return configs
+
+def load_registry(start_dir, search_parents=True, verbose=0):
+    """Load EXEC SQL patterns starting at ``start_dir``.
+
+    Configuration files named ``.exec-sql-parser`` are read from
+    ``start_dir`` and optionally its ancestors.  Each file may add or
+    remove entries from the default registry.  When ``search_parents`` is
+    ``False`` only the starting directory is considered.
+    """
+    if verbose >= 1:
+        print('Loading default configuration options')
+    registry = DEFAULT_EXEC_SQL_REGISTRY.copy()
+    for cfg_path, data in find_configs(start_dir, search_parents):
         if verbose >= 1:
             print('Loading configuration options from {0}'.format(cfg_path))
         for name, value in data.items():
@@ -194,10 +281,14 @@ def load_registry(start_dir, search_parents=True, verbose=0):
                 if pattern is None:
                     continue
                 entry = { 'pattern': pattern,
-                          'action': lambda lines: lines }
+                          'action': keep_lines }
                 if 'end_pattern' in value:
                     entry['end_pattern'] = value['end_pattern']
                 if 'error' in value:
                     entry['error'] = value['error']
                 registry[name] = entry
     return registry
+
+# Compiled once at import; ``load_registry`` results without overrides
+# reuse this snapshot.
+DEFAULT_COMPILED_REGISTRY = compile_registry(DEFAULT_EXEC_SQL_REGISTRY)
@@ -0,0 +1,146 @@
+"""Scan-only inventory of EXEC SQL constructs.
+
+:func:`scan_paths` runs only the capture stage of the formatter over
+many files.  Nothing is formatted: ``clang-format`` and ``sqlparse`` are
+not used and no debug output is written.  The result is a JSON friendly
+dictionary of per-construct and per-file counts together with the
+location of every capture failure.
+"""
+
+import os
+import time
+import multiprocessing
+
+from .core import capture_exec_sql_blocks
+from .registry import load_registry
+
+DEFAULT_EXTENSIONS = (".pc",)
+
+
+class ScanContext(object):
+    """Minimal context for :func:`capture_exec_sql_blocks` while scanning."""
+
+    __slots__ = ["input_file", "sql_dir", "format_sql", "segments", "capture_errors"]
+
+    def __init__(self, input_file):
+        self.input_file = input_file
+        self.sql_dir = None
+        self.format_sql = False
+        self.segments = []
+        self.capture_errors = []
+
+
+def collect_files(paths, extensions=DEFAULT_EXTENSIONS):
+    """Return the sorted list of files named by ``paths``.
+
+    Files are taken as given; directories are walked recursively for
+    files ending with one of ``extensions``.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                for name in filenames:
+                    if name.endswith(tuple(extensions)):
+                        files.append(os.path.join(dirpath, name))
+        else:
+            files.append(path)
+    return sorted(set(files))
+
+
+# Registries are loaded once per directory in each worker process.
+_registry_cache = {}
+
+def _registry_for(path, search_parents):
+    directory = os.path.dirname(os.path.abspath(path))
+    key = (directory, search_parents)
+    if key not in _registry_cache:
+        _registry_cache[key] = load_registry(directory, search_parents)
+    return _registry_cache[key]
+
+
+def scan_file(path, search_parents=True):
+    """Capture ``path`` and return its statistics.
+
+    The result has the keys ``file``, ``lines``, ``segments``,
+    ``constructs`` (a count per construct) and ``failures``.
+    """
+    result = {"file": path, "lines": 0, "segments": 0,
+              "constructs": {}, "failures": []}
+    try:
+        with open(path, 'r') as f:
+            lines = f.read().splitlines()
+    except (IOError, OSError, UnicodeDecodeError) as e:
+        result["failures"].append({"file": path, "line": None,
+                                   "kind": "error", "message": str(e)})
+        return result
+    result["lines"] = len(lines)
+    ctx = ScanContext(path)
+    try:
+        capture_exec_sql_blocks(ctx, lines, _registry_for(path, search_parents))
+    except Exception as e:
+        result["failures"].append({"file": path, "line": None,
+                                   "kind": "error", "message": str(e)})
+    # Capture records unaccompanied block ends and carries on, so every
+    # failure of the file is reported and its constructs still counted.
+    failures = []
+    for e in ctx.capture_errors:
+        failures.append({"file": path, "line": e.line_number,
+                         "kind": "unaccompanied-end",
+                         "message": e.line.strip()})
+    constructs = result["constructs"]
+    for construct, line_number, terminated in ctx.segments:
+        constructs[construct] = constructs.get(construct, 0) + 1
+        if not terminated:
+            failures.append({"file": path, "line": line_number,
+                             "kind": "unterminated",
+                             "message": construct})
+    failures.sort(key=lambda failure: failure["line"])
+    result["failures"].extend(failures)
+    result["segments"] = len(ctx.segments)
+    return result
+
+
+def _scan_file_args(args):
+    return scan_file(*args)
+
+
+def scan_paths(paths, jobs=None, extensions=DEFAULT_EXTENSIONS,
+               search_parents=True):
+    """Scan every file named by ``paths`` and return a summary.
+
+    ``jobs`` worker processes are used; ``None`` uses one per CPU and
+    ``1`` scans in the calling process.
+    """
+    start = time.time()
+    files = collect_files(paths, extensions)
+    work = [(path, search_parents) for path in files]
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
+    if jobs > 1 and len(files) > 1:
+        pool = multiprocessing.Pool(min(jobs, len(files)))
+        try:
+            chunksize = max(1, len(work) // (jobs * 8))
+            results = pool.map(_scan_file_args, work, chunksize)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_scan_file_args(args) for args in work]
+
+    summary = {"files": len(files), "lines": 0, "segments": 0,
+               "constructs": {}, "per_file": {}, "failures": []}
+    for result in results:
+        summary["lines"] += result["lines"]
+        summary["segments"] += result["segments"]
+        for construct, count in result["constructs"].items():
+            summary["constructs"][construct] = summary["constructs"].get(construct, 0) + count
+        summary["failures"].extend(result["failures"])
+        summary["per_file"][result["file"]] = {
+            "lines": result["lines"],
+            "segments": result["segments"],
+            "constructs": result["constructs"],
+            "failures": len(result["failures"]),
+        }
+    summary["elapsed"] = round(time.time() - start, 3)
+    return summary
@@ -0,0 +1,171 @@
+"""Bounded scheduler for ``clang-format`` subprocesses.
+
+Every call to :func:`proc_format.core.format_with_clang` runs through a
+:class:`ClangFormatScheduler`, which
+
+* caps the number of ``clang-format`` processes running at once across
+  all threads of the process,
+* kills a process that exceeds the per-call timeout,
+* retries a call once after a transient failure (a process killed by a
+  signal or a failure to start it for lack of resources),
+* and records the latency of every call for :meth:`~ClangFormatScheduler.stats`.
+
+A non-zero exit status is reported at once, since ``clang-format``
+would fail the same way again.  So is a timeout by default: an input
+that makes ``clang-format`` hang will hang it again, and a retry would
+only double the stall.  ``retry_timeouts`` retries timeouts as well.
+"""
+
+import math
+import time
+import errno
+import threading
+import subprocess
+import multiprocessing
+
+DEFAULT_TIMEOUT = 60.0
+DEFAULT_RETRIES = 1
+
+# ``Popen`` errors worth a second attempt.
+TRANSIENT_ERRNOS = frozenset([errno.EAGAIN, errno.ENOMEM, errno.EINTR,
+                              getattr(errno, 'ETXTBSY', errno.EAGAIN)])
+
+
+class ClangFormatTimeout(RuntimeError):
+    """Raised when ``clang-format`` exceeds its timeout on every attempt."""
+
+
+class _TransientFailure(Exception):
+    """Wraps the exception to raise if no attempt is left."""
+
+
+def percentile(values, fraction):
+    """Return the nearest-rank ``fraction`` percentile of sorted ``values``."""
+    if not values:
+        return None
+    rank = int(math.ceil(fraction * len(values))) - 1
+    return values[min(max(rank, 0), len(values) - 1)]
+
+
+class ClangFormatScheduler(object):
+    """Run ``clang-format`` with a concurrency cap, timeout and retry.
+
+    ``max_workers`` defaults to the number of CPUs and must be at least
+    1.  ``timeout`` is a positive number of seconds; ``None`` disables
+    it.  Timeouts are
+    retried only with ``retry_timeouts``.
+    """
+
+    def __init__(self, max_workers=None, timeout=DEFAULT_TIMEOUT,
+                 retries=DEFAULT_RETRIES, retry_timeouts=False):
+        if max_workers is None:
+            max_workers = multiprocessing.cpu_count()
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1, got {0}".format(max_workers))
+        if timeout is not None and not 0 < timeout < float("inf"):
+            raise ValueError("timeout must be positive or None, got {0}".format(timeout))
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_timeouts = retry_timeouts
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._lock = threading.Lock()
+        self.latencies = []
+        self.timeouts = 0
+        self.retried = 0
+
+    def run(self, args, content, **popen_args):
+        """Return ``(output, error, returncode)`` of ``args`` fed ``content``."""
+        attempt = 0
+        while True:
+            self._slots.acquire()
+            start = time.time()
+            try:
+                return self._run_once(args, content, popen_args)
+            except _TransientFailure as e:
+                if attempt >= self.retries:
+                    raise e.args[0]
+                attempt += 1
+                with self._lock:
+                    self.retried += 1
+            finally:
+                elapsed = time.time() - start
+                self._slots.release()
+                with self._lock:
+                    self.latencies.append(elapsed)
+
+    def _run_once(self, args, content, popen_args):
+        try:
+            process = subprocess.Popen(args, stdin=subprocess.PIPE,
+                                       stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE, **popen_args)
+        except OSError as e:
+            if e.errno in TRANSIENT_ERRNOS:
+                raise _TransientFailure(e)
+            raise
+        timed_out = []
+        timer = None
+        if self.timeout is not None:
+            def kill():
+                timed_out.append(True)
+                try:
+                    process.kill()
+                except OSError:
+                    pass
+            timer = threading.Timer(self.timeout, kill)
+            timer.daemon = True
+            timer.start()
+        try:
+            output, error = process.communicate(input=content)
+        finally:
+            if timer is not None:
+                timer.cancel()
+        if timed_out:
+            with self._lock:
+                self.timeouts += 1
+            error = ClangFormatTimeout(
+                "Clang-format timed out after {0} seconds".format(self.timeout))
+            if self.retry_timeouts:
+                raise _TransientFailure(error)
+            raise error
+        if process.returncode is not None and process.returncode < 0:
+            raise _TransientFailure(RuntimeError(
+                "Clang-format failed: killed by signal {0}".format(-process.returncode)))
+        return output, error, process.returncode
+
+    def stats(self):
+        """Return call count, retries, timeouts and p50/p95/max latency."""
+        with self._lock:
+            latencies = sorted(self.latencies)
+            result = {"calls": len(latencies), "retries": self.retried,
+                      "timeouts": self.timeouts}
+        result["p50"] = percentile(latencies, 0.50)
+        result["p95"] = percentile(latencies, 0.95)
+        result["max"] = latencies[-1] if latencies else None
+        return result
+
+    def summary(self):
+        """Return :meth:`stats` as a one-line report."""
+        stats = self.stats()
+        if not stats["calls"]:
+            return "clang-format: no calls"
+        return ("clang-format: {calls} calls, p50 {p50:.3f}s, p95 {p95:.3f}s, "
+                "max {max:.3f}s, {retries} retries, {timeouts} timeouts").format(**stats)
+
+
+_default_scheduler = None
+_default_lock = threading.Lock()
+
+def get_scheduler():
+    """Return the process-wide scheduler, creating it on first use."""
+    global _default_scheduler
+    with _default_lock:
+        if _default_scheduler is None:
+            _default_scheduler = ClangFormatScheduler()
+        return _default_scheduler
+
+def set_scheduler(scheduler):
+    """Replace the process-wide scheduler used by every formatting path."""
+    global _default_scheduler
+    with _default_lock:
+        _default_scheduler = scheduler
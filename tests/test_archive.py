@@ -0,0 +1,69 @@
+import argparse
+
+from proc_format.core import ProCFormatterContext, format_content
+from proc_format.archive import read_archive
+from proc_format.__main__ import debug_show_main
+
+
+def make_ctx(tmp_path, archive):
+    args = argparse.Namespace(input_file=str(tmp_path / 'in.pc'), output_file=None,
+                              clang_format='cat', debug=str(tmp_path / 'debug'), keep=False,
+                              debug_archive=archive, terse=True)
+    return ProCFormatterContext(args)
+
+
+def test_archive_replaces_debug_directory(tmp_path):
+    # Segments and stages are appended to one file and no debug directory is made.
+    path = str(tmp_path / 'debug.jsonl')
+    ctx = make_ctx(tmp_path, path)
+    source = "EXEC ORACLE OPTION (hold_cursor=yes);\nint x;\nEXEC SQL\n  COMMIT;\n"
+    format_content(ctx, source)
+    ctx.debug_archive.close()
+    assert ctx.debug is None and ctx.sql_dir is None
+    assert not (tmp_path / 'debug').exists()
+
+    segments = list(read_archive(path, 'in.pc', kind='segment'))
+    assert [s['index'] for s in segments] == [1, 2]
+    assert segments[0]['construct'].startswith('ORACLE-Single-Line')
+    assert segments[0]['end_pattern'] is None
+    assert segments[1]['end_pattern'] == '.*;'
+    assert segments[1]['original'] == ['EXEC SQL', '  COMMIT;']
+    stages = [r['name'] for r in read_archive(path, kind='stage')]
+    assert stages == ['before.pc', 'before.c', 'after.c', 'after.pc']
+
+
+def test_debug_show_latest_run(tmp_path, capsys):
+    # The reader prints one segment from the most recent run of a file.
+    path = str(tmp_path / 'debug.jsonl')
+    for sql in ("EXEC SQL OPEN c1;", "EXEC SQL OPEN c2;"):
+        ctx = make_ctx(tmp_path, path)
+        format_content(ctx, sql + "\n")
+        ctx.debug_archive.close()
+    assert debug_show_main([path, '--file', 'in.pc', '--index', '1']) == 0
+    out = capsys.readouterr().out
+    assert 'OPEN c2' in out
+    assert 'OPEN c1' not in out
+
+
+def test_concurrent_writers_keep_records_whole(tmp_path):
+    # Large records from several archives sharing one file never interleave.
+    import json
+    import threading
+    from proc_format.archive import DebugArchive
+    path = str(tmp_path / 'shared.jsonl')
+    archives = [DebugArchive(path) for _ in range(4)]
+
+    def writer(archive):
+        for i in range(20):
+            archive.write_stage('f.pc', 'before.pc', str(i) * 200000)
+    threads = [threading.Thread(target=writer, args=(a,)) for a in archives]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for archive in archives:
+        archive.close()
+    with open(path) as f:
+        records = [json.loads(line) for line in f]
+    assert len(records) == 80
+    assert len(set(r['run'] for r in records)) == 4
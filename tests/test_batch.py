@@ -0,0 +1,95 @@
+import os
+import sys
+import json
+import subprocess
+
+import pytest
+
+from proc_format.batch import parse_shard, shard_files, merge_manifests
+from proc_format.__main__ import merge_main
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+
+def test_parse_shard():
+    assert parse_shard('2/4') == (2, 4)
+    for text in ('0/4', '5/4', '1', 'a/b'):
+        with pytest.raises(ValueError):
+            parse_shard(text)
+
+
+@pytest.mark.parametrize('strategy', ['hash', 'size'])
+def test_shards_partition_work_set(tmp_path, strategy):
+    # Every file lands in exactly one shard, independent of input order.
+    files = []
+    for i in range(20):
+        path = tmp_path / ('f%02d.pc' % i)
+        path.write_text('x' * (i * 10))
+        files.append(str(path))
+    shards = [shard_files(files, i, 3, strategy) for i in (1, 2, 3)]
+    assert sorted(sum(shards, [])) == sorted(files)
+    assert shards == [shard_files(list(reversed(files)), i, 3, strategy) for i in (1, 2, 3)]
+
+
+def test_size_shards_are_balanced(tmp_path):
+    files = []
+    for size in (90, 50, 40, 30, 20, 10):
+        path = tmp_path / ('s%d.pc' % size)
+        path.write_text('x' * size)
+        files.append(str(path))
+    loads = [sum(os.path.getsize(p) for p in shard_files(files, i, 2, 'size')) for i in (1, 2)]
+    assert sorted(loads) == [120, 120]
+
+
+def test_shards_as_processes_merge(tmp_path):
+    # Shards run as separate processes and their manifests merge into one report.
+    for i in range(6):
+        (tmp_path / ('f%d.pc' % i)).write_text('EXEC SQL COMMIT;\nint x;\n')
+    (tmp_path / 'bad.pc').write_text('END;\n')
+    env = dict(os.environ, PYTHONPATH=SRC)
+    manifests = []
+    for i in (1, 2, 3):
+        manifest = str(tmp_path / ('shard%d.json' % i))
+        subprocess.call([sys.executable, '-m', 'proc_format', 'check', str(tmp_path),
+                         '--shard', '%d/3' % i, '--clang-format', 'cat',
+                         '--manifest', manifest], env=env)
+        manifests.append(manifest)
+    report_path = str(tmp_path / 'report.json')
+    status = subprocess.call([sys.executable, '-m', 'proc_format', 'merge',
+                              '-o', report_path] + manifests, env=env)
+    assert status == 1
+    with open(report_path) as f:
+        report = json.load(f)
+    assert len(report['files']) == 7
+    assert report['totals'] == {'unchanged': 6, 'error': 1}
+    assert report['missing_shards'] == []
+    assert report['duplicates'] == []
+
+
+def test_merge_reports_missing_shards():
+    manifest = {'shard': [1, 2], 'files': {'a.pc': {'status': 'unchanged'}}}
+    report = merge_manifests([manifest])
+    assert report['missing_shards'] == [2]
+
+
+def write_manifests(tmp_path, *manifests):
+    paths = []
+    for i, manifest in enumerate(manifests):
+        path = tmp_path / 'shard{0}.json'.format(i)
+        path.write_text(json.dumps(manifest))
+        paths.append(str(path))
+    return paths
+
+
+def test_merge_fails_on_inconsistent_shards(tmp_path, capsys):
+    # Shards must agree on the count and on which file each one checks.
+    unchanged = {'status': 'unchanged'}
+    first = {'shard': [1, 2], 'files': {'a.pc': unchanged}}
+    paths = write_manifests(tmp_path, first, {'shard': [2, 2], 'files': {'b.pc': unchanged}})
+    assert merge_main(paths + ['-o', str(tmp_path / 'report.json')]) == 0
+    paths = write_manifests(tmp_path, first, {'shard': [2, 3], 'files': {'b.pc': unchanged}})
+    assert merge_main(paths) == 1
+    assert 'disagree on the shard count' in capsys.readouterr().err
+    paths = write_manifests(tmp_path, first, {'shard': [2, 2], 'files': {'a.pc': unchanged}})
+    assert merge_main(paths + ['-o', str(tmp_path / 'report.json')]) == 1
+    assert "more than one shard: ['a.pc']" in capsys.readouterr().err
@@ -0,0 +1,64 @@
+import argparse
+
+import pytest
+from proc_format import core
+from proc_format.cache import SegmentCache
+
+SOURCE = """EXEC SQL INCLUDE SQLCA;
+EXEC ORACLE OPTION (RELEASE_CURSOR=YES);
+int main(void) {
+EXEC SQL select a
+  into :b from t;
+EXEC SQL commit;
+return 0;
+}
+"""
+
+
+def run(tmp_path, text, cache):
+    path = tmp_path / 'a.pc'
+    path.write_text(text)
+    args = argparse.Namespace(input_file=str(path), output_file=str(tmp_path / 'out.pc'),
+                              clang_format='cat', debug=None, keep=False, terse=True,
+                              segment_cache=cache)
+    core.process_file(core.ProCFormatterContext(args))
+    return (tmp_path / 'out.pc').read_text()
+
+
+@pytest.fixture
+def formatted_blocks(monkeypatch):
+    # Record the blocks passed to format_exec_sql_block.
+    calls = []
+    original = core.format_exec_sql_block
+
+    def record(lines, construct, ctx=None):
+        calls.append(list(lines))
+        return original(lines, construct, ctx)
+    monkeypatch.setattr(core, 'format_exec_sql_block', record)
+    return calls
+
+
+def test_unchanged_blocks_are_reused(tmp_path, formatted_blocks):
+    # Only new or edited blocks are formatted on a repeated run.
+    cache = SegmentCache()
+    first = run(tmp_path, SOURCE, cache)
+    assert len(formatted_blocks) == 4
+    del formatted_blocks[:]
+    assert run(tmp_path, SOURCE, cache) == first
+    # The ORACLE block is left unformatted and therefore not kept.
+    assert formatted_blocks == [['EXEC ORACLE OPTION (RELEASE_CURSOR=YES);']]
+    del formatted_blocks[:]
+    edited = SOURCE.replace('commit', 'rollback')
+    second = run(tmp_path, edited, cache)
+    assert [block[0] for block in formatted_blocks] == [
+        'EXEC ORACLE OPTION (RELEASE_CURSOR=YES);', 'EXEC SQL rollback;']
+    assert second == run(tmp_path, edited, None)
+    assert (cache.hits, cache.misses) == (5, 7)
+
+
+def test_cache_keeps_latest_files_only(tmp_path):
+    cache = SegmentCache(max_files=1)
+    run(tmp_path, SOURCE, cache)
+    assert cache.previous(str(tmp_path / 'a.pc'))
+    cache.store(str(tmp_path / 'b.pc'), {})
+    assert cache.previous(str(tmp_path / 'a.pc')) == {}
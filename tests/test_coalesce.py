@@ -0,0 +1,53 @@
+from proc_format.core import capture_exec_sql_blocks, restore_exec_sql_blocks, get_marker
+from proc_format.registry import load_registry
+
+LINES = [
+    'EXEC SQL INCLUDE SQLCA;',
+    'EXEC SQL INCLUDE ORACA;',
+    '',
+    'int main(void) {',
+    '    EXEC SQL BEGIN DECLARE SECTION;',
+    '    char * user;',
+    '    EXEC SQL END DECLARE SECTION;',
+    '    EXEC SQL WHENEVER SQLERROR GOTO failed;',
+    '    EXEC SQL WHENEVER NOT FOUND CONTINUE;',
+    '        EXEC SQL COMMIT;',
+    '    EXEC SQL WHENEVER SQLWARNING CONTINUE;',
+    '    return 0;',
+    '}',
+]
+
+
+def make_ctx(coalesce):
+    return type('Ctx', (), {'format_sql': False, 'coalesce': coalesce})
+
+
+def test_consecutive_statements_share_a_marker():
+    output, blocks = capture_exec_sql_blocks(make_ctx(True), LINES, load_registry('.'))
+    assert blocks[0] == LINES[0:2]
+    assert blocks[3] == LINES[7:9]
+    # A change of indentation ends the run.
+    assert blocks[4] == [LINES[9]]
+    assert blocks[5] == [LINES[10]]
+    assert len(blocks) == 6
+    assert output[0] == get_marker(1)
+
+
+def test_declare_section_keeps_its_own_markers():
+    output, blocks = capture_exec_sql_blocks(make_ctx(True), LINES, load_registry('.'))
+    assert '{ ' + get_marker(2) in output
+    assert '} ' + get_marker(3) in output
+    assert blocks[1] == [LINES[4]]
+    assert blocks[2] == [LINES[6]]
+
+
+def test_coalesced_round_trip():
+    registry = load_registry('.')
+    separate = capture_exec_sql_blocks(make_ctx(False), LINES, registry)
+    coalesced = capture_exec_sql_blocks(make_ctx(True), LINES, registry)
+    assert len(coalesced[1]) < len(separate[1])
+    # Markers are emitted unindented; clang-format would indent them.
+    restored = [restore_exec_sql_blocks("\n".join(output), blocks)
+                for output, blocks in (separate, coalesced)]
+    assert restored[0] == restored[1]
+    assert [line.strip() for line in restored[1].split("\n")] == [line.strip() for line in LINES]
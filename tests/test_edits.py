@@ -0,0 +1,78 @@
+import io
+import json
+import sys
+
+from proc_format.edits import compute_edits, apply_edits
+from proc_format.__main__ import edits_main
+
+
+def test_compute_edits_minimal_replacement():
+    # Only the differing characters of a changed line are replaced.
+    before = "int main() {\nint  x;\n}\n"
+    after = "int main() {\n    int x;\n}\n"
+    edits = compute_edits(before, after)
+    assert edits == [
+        {"start": {"line": 2, "column": 0}, "end": {"line": 2, "column": 4}, "text": "    int"},
+    ]
+    assert apply_edits(before, edits) == after
+
+
+def test_compute_edits_round_trip():
+    # Applying the edits reproduces the formatted text.
+    before = "a\nb\nc\nd\n"
+    after = "a\nB\nc\nd\ne"
+    edits = compute_edits(before, after)
+    assert apply_edits(before, edits) == after
+    assert compute_edits(after, after) == []
+
+
+def test_compute_edits_region():
+    # Edits outside the requested region are dropped.
+    before = "x\ny\nz\n"
+    after = "X\ny\nZ\n"
+    edits = compute_edits(before, after, region=(3, 3))
+    assert len(edits) == 1
+    assert edits[0]["start"] == {"line": 3, "column": 0}
+    assert apply_edits(before, edits) == "x\ny\nZ\n"
+
+
+def test_edits_main_reports_json(monkeypatch, capsys, tmp_path):
+    # The subcommand reads stdin and prints the edit list as JSON.
+    source = "EXEC SQL COMMIT WORK RELEASE;\nint  x;\n"
+    monkeypatch.setattr(sys, 'stdin', io.StringIO(source))
+    edits_main(["--clang-format", "cat",
+                "--assume-filename", str(tmp_path / "f.pc")])
+    result = json.loads(capsys.readouterr().out)
+    assert result == {"edits": []}
+
+
+def test_compute_edits_insertion_at_end_of_file():
+    # The end of a newline-terminated buffer is the start of the next line.
+    edits = compute_edits('a\n', 'a\nb\n')
+    assert edits == [{"start": {"line": 2, "column": 0}, "end": {"line": 2, "column": 0},
+                      "text": "b\n"}]
+    assert apply_edits('a\n', edits) == 'a\nb\n'
+    assert apply_edits('a', compute_edits('a', 'ab')) == 'ab'
+
+
+def test_compute_edits_form_feed_is_not_a_line_break():
+    # Only newlines separate lines; a form feed stays within its line.
+    before = 'int x;\n\x0c\nint  y;\n'
+    after = 'int x;\n\x0c\nint y;\n'
+    edits = compute_edits(before, after)
+    assert [edit["start"]["line"] for edit in edits] == [3]
+    assert apply_edits(before, edits) == after
+
+
+def test_compute_edits_large_buffer_is_fast():
+    # Repeated braces and blank lines do not make the diff quadratic.
+    import time
+    before = ''.join('int f%d(void)\n{\n    if (x) {\n        y();\n    }\n\n    return 0;\n}\n\n'
+                     % (i % 50) for i in range(2200))
+    after = before.replace('    ', '  ')
+    start = time.time()
+    edits = compute_edits(before, after)
+    region_edits = compute_edits(before, after, region=(10000, 10020))
+    assert time.time() - start < 5.0
+    assert apply_edits(before, edits) == after
+    assert region_edits and all(edit in edits for edit in region_edits)
@@ -0,0 +1,45 @@
+import json
+
+from proc_format.core import format_exec_sql_block, warn_summary
+from proc_format.events import EventCollector
+
+
+class Ctx(object):
+    def __init__(self, events, input_file='a.pc'):
+        self.events = events
+        self.input_file = input_file
+        self.verbose = 0
+        self.terse = False
+        self.silent = False
+
+
+def test_collector_replaces_per_block_warnings(capsys, tmp_path):
+    # Skipped blocks are counted, not printed, and streamed as JSON Lines.
+    stream = str(tmp_path / 'events.jsonl')
+    events = EventCollector(stream)
+    for name in ('a.pc', 'a.pc', 'b.pc'):
+        format_exec_sql_block(['EXEC ORACLE OPTION (x=y);'], 'ORACLE-Single-Line [1]',
+                              Ctx(events, name))
+    format_exec_sql_block([], 'STATEMENT-Multi-Line', Ctx(events, 'b.pc'))
+    events.close()
+    assert capsys.readouterr().err == ''
+    assert events.total() == 4
+    assert events.total('a.pc') == 2
+    assert events.summary() == [
+        'sqlparse: skipped - ORACLE block: 3 (ORACLE-Single-Line [1]: 3)',
+        'sqlparse: skipped - empty block: 1 (STATEMENT-Multi-Line: 1)',
+    ]
+    with open(stream) as f:
+        records = [json.loads(line) for line in f]
+    assert len(records) == 4
+    assert records[0] == {'reason': 'sqlparse: skipped - ORACLE block',
+                          'construct': 'ORACLE-Single-Line [1]', 'file': 'a.pc'}
+
+
+def test_warn_summary(capsys):
+    events = EventCollector()
+    events.add('sqlparse: skipped - pattern mismatch', 'CUSTOM', 'a.pc')
+    warn_summary(events, header='Warnings:')
+    assert capsys.readouterr().err == 'Warnings:\n  sqlparse: skipped - pattern mismatch: 1 (CUSTOM: 1)\n'
+    warn_summary(events, Ctx(events), file_name='other.pc')
+    assert capsys.readouterr().err == ''
@@ -0,0 +1,55 @@
+import random
+
+import pytest
+from proc_format.keywords import normalize_keywords
+
+sqlparse = pytest.importorskip('sqlparse')
+
+FAST_STATEMENTS = [
+    'COMMIT', 'COMMIT WORK', 'COMMIT WORK RELEASE', 'ROLLBACK',
+    'ROLLBACK WORK RELEASE', 'ROLLBACK RELEASE',
+    'WHENEVER SQLERROR GOTO sql_error', 'WHENEVER NOT FOUND CONTINUE',
+    'WHENEVER SQLWARNING DO BREAK', 'WHENEVER NOT FOUND DO CONTINUE',
+    'WHENEVER SQLERROR STOP', 'WHENEVER SQLERROR CONTINUE',
+    'CONNECT :uid', 'CONNECT :usr IDENTIFIED BY :pwd',
+    'CONNECT :usr IDENTIFIED BY :pwd USING :db_string',
+    'OPEN emp_cursor', 'CLOSE emp_cursor', 'OPEN c', 'CLOSE user',
+    'OPEN section', 'INCLUDE SQLCA', 'INCLUDE oraca',
+    'BEGIN DECLARE SECTION', 'END DECLARE SECTION',
+]
+
+SLOW_STATEMENTS = [
+    'SELECT * FROM dual', 'WHENEVER SQLERROR GO TO err',
+    'WHENEVER SQLERROR DO sql_error("oops")', 'OPEN c USING :a',
+    'OPEN a.b', 'CLOSE c$1', 'OPEN like', 'INCLUDE "file.h"',
+    'COMMIT WORK /* done */', 'AT :db COMMIT',
+    'WHENEVER SQLERROR GOTO go', 'OPEN go',
+]
+
+
+def variants(statement, rng):
+    # Yield the statement in assorted casing and spacing.
+    words = statement.split(' ')
+    yield statement + ';'
+    yield statement.lower() + ';'
+    for _ in range(10):
+        cased = [''.join(ch.upper() if rng.random() < 0.5 else ch.lower() for ch in w)
+                 for w in words]
+        spacing = [rng.choice([' ', '  ', '\t', '\n']) for _ in words[1:]]
+        text = cased[0] + ''.join(s + w for s, w in zip(spacing, cased[1:]))
+        yield text + rng.choice([';', ' ;', ''])
+
+
+@pytest.mark.parametrize('statement', FAST_STATEMENTS)
+def test_fast_path_matches_sqlparse(statement):
+    # Differential check: the fast path reproduces sqlparse's output.
+    rng = random.Random(statement)
+    for text in variants(statement, rng):
+        fast = normalize_keywords(text)
+        assert fast is not None, text
+        assert fast == sqlparse.format(text, keyword_case='upper'), text
+
+
+@pytest.mark.parametrize('statement', SLOW_STATEMENTS)
+def test_complex_statements_defer_to_sqlparse(statement):
+    assert normalize_keywords(statement + ';') is None
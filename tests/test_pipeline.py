@@ -0,0 +1,68 @@
+import time
+
+from proc_format.pipeline import run_pipeline, StageError
+from proc_format.batch import check_files
+
+
+def test_pipeline_preserves_order_and_errors():
+    # Results come back in input order; a failing item skips later stages.
+    def double(x):
+        return x * 2
+
+    def check(x):
+        if x == 6:
+            raise ValueError('six')
+        return x
+
+    results = list(run_pipeline(range(5), [double, check, str], queue_size=1))
+    assert results[:3] == ['0', '2', '4']
+    assert isinstance(results[3], StageError)
+    assert results[3].stage == 1
+    assert results[3].item == 6
+    assert results[4] == '8'
+
+
+def test_pipeline_overlaps_stages():
+    # With three equal stages, total time approaches one stage per item.
+    def stage(x):
+        time.sleep(0.05)
+        return x
+
+    start = time.time()
+    assert list(run_pipeline(range(8), [stage, stage, stage])) == list(range(8))
+    elapsed = time.time() - start
+    assert elapsed < 8 * 3 * 0.05 * 0.75
+
+
+def test_check_files_pipelined_matches_sequential(tmp_path):
+    files = []
+    for i, text in enumerate(['EXEC SQL COMMIT;\n', 'int x;\n', 'END;\n', 'EXEC SQL commit;\n']):
+        path = tmp_path / ('f%d.pc' % i)
+        path.write_text(text)
+        files.append(str(path))
+    pipelined = check_files(files, clang_format='cat')
+    sequential = check_files(files, clang_format='cat', pipelined=False)
+    status = lambda m: dict((p, e['status']) for p, e in m['files'].items())
+    assert status(pipelined) == status(sequential)
+    assert pipelined['totals'] == {'unchanged': 2, 'error': 1, 'changed': 1}
+
+
+def test_check_files_seconds_exclude_queue_waits(tmp_path):
+    # Per-file seconds cover the file's own stages, not waits behind others.
+    from proc_format.scheduler import ClangFormatScheduler, get_scheduler, set_scheduler
+    slow = tmp_path / 'slow-clang-format'
+    slow.write_text('#!/bin/sh\nsleep 0.3\nexec cat\n')
+    slow.chmod(0o755)
+    files = []
+    for i in range(4):
+        path = tmp_path / ('f%d.pc' % i)
+        path.write_text('int x;\n')
+        files.append(str(path))
+    previous = get_scheduler()
+    set_scheduler(ClangFormatScheduler(max_workers=1, timeout=None))
+    try:
+        manifest = check_files(files, clang_format=str(slow))
+    finally:
+        set_scheduler(previous)
+    seconds = [entry['seconds'] for entry in manifest['files'].values()]
+    assert all(0.25 < s < 0.6 for s in seconds), seconds
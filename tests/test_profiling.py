@@ -0,0 +1,56 @@
+import json
+
+from proc_format.core import capture_exec_sql_blocks
+from proc_format.registry import load_registry
+from proc_format.profiling import PatternProfile
+from proc_format.__main__ import validate_registry_main
+
+
+def write(path, text):
+    path.write_text(text)
+    return str(path)
+
+
+def test_profile_counts_pattern_calls_and_matches():
+    # Capture records the calls and matches of each pattern it tries.
+    profile = PatternProfile()
+    ctx = type('Ctx', (), {'format_sql': False, 'profile': profile})
+    lines = ['int x;', 'EXEC SQL COMMIT;', 'EXEC SQL SELECT 1', '  FROM dual;']
+    output, blocks = capture_exec_sql_blocks(ctx, lines, load_registry('.', search_parents=False))
+    assert len(blocks) == 2
+    stats = dict(((item['construct'], item['kind']), item) for item in profile.top())
+    single = stats[('STATEMENT-Single-Line [1]', 'pattern')]
+    assert single['matches'] == 1
+    end = stats[('STATEMENT-Multi-Line', 'end_pattern')]
+    assert (end['calls'], end['matches']) == (1, 1)
+    # Patterns after the one matching a line are not tried on it.
+    assert stats[('STATEMENT-Multi-Line', 'pattern')]['calls'] == 2
+    seconds = [item['seconds'] for item in profile.top()]
+    assert seconds == sorted(seconds, reverse=True)
+    assert len(profile.report(3)) == 3
+
+
+def test_validate_registry_reports_slow_and_invalid_patterns(tmp_path, capsys):
+    # Configured patterns are benchmarked; invalid or slow ones fail.
+    sub = tmp_path / 'sub'
+    sub.mkdir()
+    write(sub / '.exec-sql-parser',
+          '{"SLOW": {"pattern": "(a+)+b"}, "BAD": {"pattern": "EXEC ("}}')
+    write(sub / 'a.pc', "EXEC SQL COMMIT;\n" + "a" * 18 + "c\n")
+    assert validate_registry_main([str(tmp_path), '--json', '--no-registry-parents']) == 1
+    report = json.loads(capsys.readouterr().out)
+    assert report['lines'] == 2
+    results = dict((item['construct'], item) for item in report['patterns'])
+    assert 'error' in results['BAD']
+    assert results['SLOW']['config'].endswith('.exec-sql-parser')
+    assert results['STATEMENT-Multi-Line']['config'] == '<default>'
+    slowest = [item for item in report['patterns'] if 'error' not in item][0]
+    assert slowest['construct'] == 'SLOW'
+
+
+def test_validate_registry_threshold(tmp_path, capsys):
+    # The default patterns pass a generous per-line limit.
+    write(tmp_path / 'a.pc', "EXEC SQL COMMIT;\nint x;\n")
+    assert validate_registry_main([str(tmp_path), '--no-registry-parents',
+                                   '--max-us', '1000']) == 0
+    assert 'patterns over 2 lines of 1 files' in capsys.readouterr().out
@@ -108,3 +108,35 @@ def test_capture_exec_sql_blocks_variants():
         assert len(markers) == 9
     finally:
         shutil.rmtree(tmpdir)
+
+
+def test_compile_registry_order_and_deduplication():
+    # Longer patterns come first and duplicate entries are dropped on 3.9+.
+    from proc_format.registry import compile_registry, DEDUPLICATE
+    entries = compile_registry(load_registry('.', search_parents=False))
+    lengths = [len(entry.details['pattern']) for entry in entries]
+    assert lengths == sorted(lengths, reverse=True)
+    names = [entry.name for entry in entries]
+    assert 'STATEMENT-Single-Line [1]' in names
+    assert ('STATEMENT-Single-Line [2]' in names) != DEDUPLICATE
+    assert all(hasattr(entry.pattern, 'match') for entry in entries)
+
+
+def test_compile_registry_shares_snapshots():
+    # Equal registries, including loaded overrides, share one compiled snapshot.
+    from proc_format.registry import compile_registry, DEFAULT_COMPILED_REGISTRY
+    assert compile_registry(load_registry('.', search_parents=False)) is DEFAULT_COMPILED_REGISTRY
+    base = tempfile.mkdtemp()
+    try:
+        write_cfg(base, '{"CUSTOM": {"pattern": "EXEC SQL TEST;"}}')
+        first = compile_registry(load_registry(base, search_parents=False))
+        second = compile_registry(load_registry(base, search_parents=False))
+        assert first is second
+        assert first is not DEFAULT_COMPILED_REGISTRY
+        custom = [entry for entry in first if entry.name == 'CUSTOM'][0]
+        default = dict((entry.name, entry) for entry in DEFAULT_COMPILED_REGISTRY)
+        # Patterns are compiled once across registries.
+        assert default['END'].pattern is [e for e in first if e.name == 'END'][0].pattern
+        assert custom.end_pattern is None
+    finally:
+        shutil.rmtree(base)
@@ -17,3 +17,37 @@ def test_restore_exec_sql_blocks_missing_segment():
     segments = [["EXEC SQL SELECT 1;"], ["EXEC SQL SELECT 2;"]]
     with pytest.raises(ValueError):
         restore_exec_sql_blocks(content, segments)
+
+
+def test_restore_exec_sql_blocks_out_of_sequence():
+    # Markers found in the wrong order keep today's error message.
+    content = "\n".join([get_marker(2), get_marker(1)])
+    segments = [["EXEC SQL SELECT 1;"], ["EXEC SQL SELECT 2;"]]
+    with pytest.raises(ValueError) as e:
+        restore_exec_sql_blocks(content, segments)
+    assert "Marker out of sequence: expected 1, found 2" in str(e.value)
+
+
+def test_restore_exec_sql_blocks_extra_marker():
+    # A marker beyond the captured segments is reported.
+    content = "\n".join([get_marker(1), "int x;", get_marker(2)])
+    with pytest.raises(ValueError) as e:
+        restore_exec_sql_blocks(content, [["EXEC SQL COMMIT;"]])
+    assert "Invalid or missing marker" in str(e.value)
+
+
+def test_restore_exec_sql_blocks_keeps_segments():
+    # Restoring twice gives the same result; segments are not consumed.
+    content = "{\n    " + get_marker(1) + "\n  {  // EXEC  SQL  MARKER :2:\n}\n"
+    segments = [["EXEC SQL SELECT a", "  INTO :b;"], ["EXEC SQL COMMIT;"]]
+    first = restore_exec_sql_blocks(content, segments)
+    assert restore_exec_sql_blocks(content, segments) == first
+    assert first == "{\n    EXEC SQL SELECT a\n      INTO :b;\n  EXEC SQL COMMIT;\n}\n"
+    assert segments[0] == ["EXEC SQL SELECT a", "  INTO :b;"]
+
+
+def test_restore_exec_sql_blocks_marker_word_in_code():
+    # Unrelated occurrences of MARKER do not disturb the restore.
+    content = "int MARKER = 1;\n" + get_marker(1) + "\n// MARKER\n"
+    restored = restore_exec_sql_blocks(content, [["EXEC SQL COMMIT;"]])
+    assert restored == "int MARKER = 1;\nEXEC SQL COMMIT;\n// MARKER\n"
@@ -0,0 +1,55 @@
+import json
+
+from proc_format.scan import scan_paths, scan_file
+from proc_format.__main__ import scan_main
+
+
+def write(path, text):
+    path.write_text(text)
+    return str(path)
+
+
+def test_scan_counts_constructs(tmp_path):
+    # Constructs are counted per file and in total without formatting.
+    write(tmp_path / 'a.pc', "EXEC SQL commit;\nint x;\nEXEC SQL\n  SELECT 1;\n")
+    write(tmp_path / 'b.pc', "EXEC ORACLE OPTION (x=y);\n")
+    write(tmp_path / 'notes.txt', "EXEC SQL commit;\n")
+    summary = scan_paths([str(tmp_path)], jobs=2)
+    assert summary['files'] == 2
+    assert summary['lines'] == 5
+    assert summary['segments'] == 3
+    assert summary['constructs']['STATEMENT-Multi-Line'] == 1
+    assert sum(summary['constructs'].values()) == 3
+    assert summary['per_file'][str(tmp_path / 'a.pc')]['segments'] == 2
+    assert summary['failures'] == []
+
+
+def test_scan_reports_failures(tmp_path):
+    # Unaccompanied END statements and unterminated blocks are located.
+    path = write(tmp_path / 'bad.pc', "int x;\n    END-EXEC;\n")
+    result = scan_file(path)
+    assert result['failures'] == [{'file': path, 'line': 2,
+                                   'kind': 'unaccompanied-end',
+                                   'message': 'END-EXEC;'}]
+    path = write(tmp_path / 'open.pc', "EXEC SQL EXECUTE\nBEGIN\n  NULL;\n")
+    result = scan_file(path)
+    assert [(f['kind'], f['line']) for f in result['failures']] == [('unterminated', 1)]
+
+
+def test_scan_main_json(tmp_path, capsys):
+    # The subcommand prints JSON and exits non-zero on failures.
+    write(tmp_path / 'bad.pc', "END;\n")
+    assert scan_main([str(tmp_path), '-j', '1']) == 1
+    summary = json.loads(capsys.readouterr().out)
+    assert summary['failures'][0]['line'] == 1
+
+
+def test_scan_reports_every_failure_in_a_file(tmp_path):
+    # Capture continues past an unaccompanied END, so later constructs
+    # and failures are still reported.
+    path = write(tmp_path / 'many.pc', "END;\nEXEC SQL COMMIT;\nEND;\nEXEC SQL\n SELECT 1\n")
+    result = scan_file(path)
+    assert result['segments'] == 2
+    assert result['constructs'] == {'STATEMENT-Single-Line [1]': 1, 'STATEMENT-Multi-Line': 1}
+    assert [(f['kind'], f['line']) for f in result['failures']] == [
+        ('unaccompanied-end', 1), ('unaccompanied-end', 3), ('unterminated', 4)]
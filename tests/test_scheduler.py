@@ -0,0 +1,88 @@
+import time
+import threading
+import subprocess
+
+import pytest
+
+from proc_format.scheduler import ClangFormatScheduler, ClangFormatTimeout, percentile
+
+
+def test_timeout_is_not_retried_by_default():
+    # A hung process is killed at the timeout and reported at once.
+    scheduler = ClangFormatScheduler(max_workers=1, timeout=0.2)
+    with pytest.raises(ClangFormatTimeout):
+        scheduler.run(['sleep', '5'], b'')
+    stats = scheduler.stats()
+    assert (stats['calls'], stats['retries'], stats['timeouts']) == (1, 0, 1)
+
+
+def test_timeout_kills_and_retries_once():
+    # With retry_timeouts a hung process is retried once before failing.
+    scheduler = ClangFormatScheduler(max_workers=1, timeout=0.2, retries=1,
+                                     retry_timeouts=True)
+    start = time.time()
+    with pytest.raises(ClangFormatTimeout):
+        scheduler.run(['sleep', '5'], b'')
+    assert time.time() - start < 3
+    stats = scheduler.stats()
+    assert stats['calls'] == 2
+    assert stats['retries'] == 1
+    assert stats['timeouts'] == 2
+
+
+def test_exit_status_is_not_retried():
+    scheduler = ClangFormatScheduler(timeout=5)
+    output, error, returncode = scheduler.run(['false'], b'')
+    assert returncode != 0
+    assert scheduler.stats()['retries'] == 0
+
+
+def test_concurrency_cap(monkeypatch):
+    # No more than max_workers processes run at once.
+    state = {'running': 0, 'peak': 0}
+    lock = threading.Lock()
+
+    class DummyPopen(object):
+        def __init__(self, *args, **kwargs):
+            self.returncode = 0
+        def communicate(self, input=None):
+            with lock:
+                state['running'] += 1
+                state['peak'] = max(state['peak'], state['running'])
+            time.sleep(0.02)
+            with lock:
+                state['running'] -= 1
+            return input, ''
+
+    monkeypatch.setattr(subprocess, 'Popen', DummyPopen)
+    scheduler = ClangFormatScheduler(max_workers=2, timeout=None)
+    threads = [threading.Thread(target=scheduler.run, args=(['clang-format'], 'x'))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert state['peak'] == 2
+    assert scheduler.stats()['calls'] == 8
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 0.50) == 50
+    assert percentile(values, 0.95) == 95
+    assert percentile([], 0.5) is None
+
+
+def test_worker_count_must_be_positive():
+    from proc_format.__main__ import main
+    with pytest.raises(ValueError):
+        ClangFormatScheduler(max_workers=0)
+    for timeout in (0, -1, float('nan')):
+        with pytest.raises(ValueError):
+            ClangFormatScheduler(max_workers=1, timeout=timeout)
+    for value in ('0', '-2'):
+        with pytest.raises(SystemExit):
+            main(['check', '--clang-jobs', value, '.'])
+    for value in ('-1', 'nan', 'inf', 'soon'):
+        with pytest.raises(SystemExit):
+            main(['check', '--clang-timeout', value, '.'])